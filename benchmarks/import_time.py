@@ -0,0 +1,50 @@
+
+'''
+Measure the time a fresh interpreter spends to start a session, in different fashions.
+
+Each scenario runs in its own process, `--repeat` times, and the best and median wall
+clock times are reported; run me from the repository root, as in
+
+    python3 benchmarks/import_time.py --repeat 10
+'''
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+src = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src')
+
+scenarios = [   ('interpreter only', 'pass'),
+                ('sympy', 'import sympy'),
+                ('start_session.py', 'exec(open("start_session.py").read())'),
+                ('import session', 'import session'),
+                ('session, first spec', 'import session; session.recurrence_spec'),
+                ('session, star import', 'from session import *'), ]
+
+def measure(python, statement, repeat):
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.check_call([python, '-c', statement], cwd=src)
+        timings.append(time.perf_counter() - started)
+
+    return min(timings), statistics.median(timings)
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='runs for each scenario')
+    parser.add_argument('--python', default=sys.executable, help='interpreter to measure')
+    args = parser.parse_args()
+
+    print('{:<24}{:>12}{:>12}'.format('scenario', 'best (s)', 'median (s)'))
+    for name, statement in scenarios:
+        best, median = measure(args.python, statement, args.repeat)
+        print('{:<24}{:>12.3f}{:>12.3f}'.format(name, best, median))
+
+if __name__ == '__main__':
+    main()
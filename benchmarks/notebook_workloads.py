@@ -0,0 +1,171 @@
+
+'''
+Run the workloads of notebooks at parameterized depths and matrix sizes.
+
+For each workload and parameter I report wall clock time, peak memory allocated while
+running (as traced by `tracemalloc`) and the size of the resulting expressions, namely
+the number of nodes of their trees; results are saved as JSON, to compare runs across
+commits or SymPy versions. Run me from the repository root, as in
+
+    python3 benchmarks/notebook_workloads.py --depths 2 4 6 --sizes 6 10 --output run.json
+'''
+
+import argparse
+import functools
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+src = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'src')
+sys.path.insert(0, src)
+sys.setrecursionlimit(100000)
+
+import sympy
+from sympy import IndexedBase, Eq, Integer, Basic, Matrix, preorder_traversal
+from sympy.abc import n, k, i, x
+from sympy.core.cache import clear_cache
+
+from recurrences import *
+
+@functools.lru_cache(maxsize=None)
+def doubly_indexed_namespace():
+    '''
+    Load `doubly-indexed-recurrences.py` as notebooks do with `%run`, once.
+    '''
+    namespace = {}
+    exec('from terms import *', namespace)
+    with open(os.path.join(src, 'doubly-indexed-recurrences.py')) as module:
+        exec(compile(module.read(), 'doubly-indexed-recurrences.py', 'exec'), namespace)
+    return namespace
+
+# workloads {{{
+#________________________________________________________________________
+
+def fibonacci_unfolding(depth):
+    f = IndexedBase('f')
+    fib = recurrence_spec(recurrence_eq=Eq(f[n+2], f[n+1]+f[n]), recurrence_symbol=f, variables=[n])
+    unfolded = fib.unfold(depth=depth)
+    instantiated = unfolded.instantiate(strategy=based(arity=unary_indexed()))
+    return [unfolded.involute().recurrence_eq,
+            instantiated.subsume(additional_terms={f[0]:Integer(0), f[1]:Integer(1)}).involute().recurrence_eq]
+
+def fibonacci_matrix_vector_product(depth):
+    f = IndexedBase('f')
+    fib = recurrence_spec(recurrence_eq=Eq(f[n+2], f[n+1]+f[n]), recurrence_symbol=f, variables=[n])
+    m, v, r, eqs = fib.matrix_vector_product(depth=depth, arity=unary_indexed(),
+                                             segment=[Integer(j) for j in range(0, 2*depth+2)],
+                                             based_instantiation=True)
+    return [m, r]
+
+def doubly_indexed_unfolding(recurrence_eq, indexed):
+    def workload(depth):
+        rec_spec = recurrence_spec(recurrence_eq=recurrence_eq, recurrence_symbol=indexed, variables=[n, k])
+        unfolded = rec_spec.unfold(depth=depth)
+        return [unfolded.recurrence_eq,
+                unfolded.instantiate(strategy=based(arity=doubly_indexed())).subsume().recurrence_eq]
+    return workload
+
+def quicksort_average_analysis(depth):
+    c = IndexedBase('c')
+    qs = recurrence_spec(recurrence_eq=Eq(c[n]/(n+1), 2/(n+1) + c[n-1]/n), recurrence_symbol=c, variables=[n])
+    unfolded = qs.unfold(depth=depth)
+    instantiated = unfolded.instantiate(strategy=based(arity=unary_indexed()))
+    return [unfolded.recurrence_eq, instantiated.subsume(additional_terms={c[0]:Integer(0)}).recurrence_eq]
+
+def horner_method(depth):
+    y, b = IndexedBase('y'), IndexedBase('b')
+    hs = recurrence_spec(recurrence_eq=Eq(y[i], x*y[i-1]+b[i]), recurrence_symbol=y, variables=[i])
+    unfolded = hs.unfold(depth=depth)
+    return [unfolded.involute().recurrence_eq.doit(),
+            unfolded.instantiate(strategy=based(arity=unary_indexed())).recurrence_eq.doit()]
+
+def matrix_factorization(rec_builder):
+    def workload(size):
+        namespace = doubly_indexed_namespace()
+        indexed = IndexedBase('m')
+        matrix = namespace['symbolic_matrix']((size, size), indexed)
+        factorization = namespace['factorize_matrix_as_matrices_sum'](
+            matrix, length=size//2, Arec=rec_builder(indexed), perform_check=False)
+        return [factorization['splitted']] + list(factorization['expansion'].values())
+    return workload
+
+d, s = IndexedBase('d'), IndexedBase('s')
+
+workloads = [   ('fibonacci-unfolding', 'depth', fibonacci_unfolding),
+                ('fibonacci-matrix-vector-product', 'depth', fibonacci_matrix_vector_product),
+                ('pascal-unfolding', 'depth', doubly_indexed_unfolding(Eq(d[n+1, k+1], d[n, k] + d[n, k+1]), d)),
+                ('stirling-II-unfolding', 'depth', doubly_indexed_unfolding(Eq(s[n+1, k+1], s[n, k] + (k+1)*s[n, k+1]), s)),
+                ('quicksort-average-analysis', 'depth', quicksort_average_analysis),
+                ('horner-method', 'depth', horner_method),
+                ('pascal-factorization', 'size', matrix_factorization(
+                    lambda m: Eq(m[n+1,k+1], m[n,k] + m[n,k+1]))),
+                ('shapiro-catalan-factorization', 'size', matrix_factorization(
+                    lambda m: Eq(m[n+1,k+1], m[n,k] + 2*m[n,k+1] + m[n,k+2]))), ]
+
+#________________________________________________________________________}}}
+
+def expression_size(terms):
+    size = 0
+    for term in terms:
+        if isinstance(term, Matrix): size += sum(expression_size([entry]) for entry in term)
+        elif isinstance(term, Basic): size += sum(1 for _ in preorder_traversal(term))
+        else: size += 1
+    return size
+
+def run(name, workload, parameter):
+
+    clear_cache()
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result, error = workload(parameter), None
+    except Exception as e:
+        result, error = [], '{}: {}'.format(type(e).__name__, e)
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return dict(workload=name, parameter=parameter, wall=wall, peak_bytes=peak,
+                expression_size=expression_size(result), error=error)
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=src,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--depths', type=int, nargs='+', default=[2, 4, 6], help='unfolding depths')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[6, 10], help='matrix sizes')
+    parser.add_argument('--only', nargs='+', default=None, choices=[name for name, _, _ in workloads],
+                        help='workloads to run, all by default')
+    parser.add_argument('--output', default=None, help='JSON file where results are saved')
+    args = parser.parse_args()
+
+    doubly_indexed_namespace() # loaded here to leave it out of measurements
+
+    results = []
+    print('{:<34}{:>6}{:>12}{:>14}{:>12}'.format('workload', 'param', 'wall (s)', 'peak (KiB)', 'size'))
+    for name, kind, workload in workloads:
+        if args.only and name not in args.only: continue
+        for parameter in (args.depths if kind == 'depth' else args.sizes):
+            outcome = run(name, workload, parameter)
+            results.append(outcome)
+            print('{:<34}{:>6}{:>12.3f}{:>14.1f}{:>12}{}'.format(
+                name, parameter, outcome['wall'], outcome['peak_bytes'] / 1024, outcome['expression_size'],
+                '  ({})'.format(outcome['error']) if outcome['error'] else ''))
+
+    if args.output:
+        report = dict(commit=current_commit(), python=platform.python_version(), sympy=sympy.__version__,
+                      timestamp=time.strftime('%Y-%m-%dT%H:%M:%S'), results=results)
+        with open(args.output, 'w') as output: json.dump(report, output, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+
+import sys
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping, MutableMapping
+
+from sympy import Basic, preorder_traversal
+
+from profiling import count
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'maxbytes', 'currsize', 'currbytes'])
+
+class cache_stats:
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+class shared_entries:
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.sizes, self.generations = {}, {}
+        self.currbytes, self.latest = 0, 0
+
+def approximate_bytes(term):
+    '''
+    Approximate the memory footprint of `term`, summing the size of every node of its tree.
+    '''
+    if not isinstance(term, Basic): return sys.getsizeof(term)
+    return sum(sys.getsizeof(subterm) for subterm in preorder_traversal(term))
+
+class lru_terms_cache(MutableMapping):
+    '''
+    Mapping from terms to their unfolded definitions, bounded and instrumented.
+
+    Keys are SymPy terms, therefore they are hashed structurally by SymPy itself. I evict
+    the least recently used entries as soon as `maxsize` entries or `maxbytes` bytes are
+    exceeded (by default neither bound applies) and I count hits, misses and evictions of
+    `lookup` requests; such counters are shared among caches obtained by `copy` and `derive`,
+    so they describe a whole unfolding session, and they are reported to `profiling.count`
+    as `'<name> hits'` and `'<name> misses'`, so that caches of different purposes, given
+    different `name`s, are told apart.
+
+    A `copy` costs `O(1)`, since it shares my entries and hands their ownership over to the
+    copy: entries are tagged by the generation of the cache that stored them, so I keep
+    seeing the ones stored up to my copy only and, as soon as I'm used again, I detach by
+    copying them. The copy owns the storage, and replacing or deleting an entry that I may
+    see detaches the copy as well; on the contrary, evictions, as the recency order, affect
+    every cache sharing the storage, since bounds are about the storage as a whole.
+
+    Examples
+    ========
+
+    >>> from sympy import IndexedBase, symbols
+    >>> f, n = IndexedBase('f'), symbols('n')
+    >>> cache = lru_terms_cache(maxsize=2)
+    >>> cache[f[n+1]] = f[n] + f[n-1]
+    >>> cache[f[n]] = f[n-1] + f[n-2]
+    >>> cache.lookup(f[n+1])
+    f[n - 1] + f[n]
+    >>> cache[f[n-1]] = f[n-2] + f[n-3]
+    >>> sorted(cache.keys(), key=str)
+    [f[n + 1], f[n - 1]]
+    >>> cache.lookup(f[n]) is None
+    True
+    >>> cache.cache_info()
+    CacheInfo(hits=1, misses=1, evictions=1, maxsize=2, maxbytes=None, currsize=2, currbytes=None)
+    >>> from profiling import profiling
+    >>> with profiling() as profile:
+    ...     _ = cache.lookup(f[n+1]), lru_terms_cache(name='latex_cache').lookup(f[n+1])
+    >>> sorted(profile.counters.items())
+    [('latex_cache misses', 1), ('terms_cache hits', 1)]
+    '''
+
+    def __init__(self, items=(), maxsize=None, maxbytes=None, stats=None, name='terms_cache'):
+        self.name = name
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.stats = cache_stats() if stats is None else stats
+        self.shared, self.generation = shared_entries(), 0
+        self.update(items)
+
+    @property
+    def entries(self): return self.own().entries
+
+    @property
+    def sizes(self): return self.own().sizes
+
+    @property
+    def currbytes(self): return self.own().currbytes
+
+    def own(self, detach=False):
+        '''
+        Return the storage of my entries, copying the ones I see in a storage of my own if a
+        later copy of mine owns the shared one, or if `detach` is true.
+        '''
+        shared = self.shared
+        if self.generation == shared.latest and not detach: return shared
+
+        owned = shared_entries()
+        for key, value in shared.entries.items():
+            if shared.generations[key] > self.generation: continue
+            owned.entries[key], owned.generations[key] = value, 0
+            if key in shared.sizes: 
+                owned.sizes[key] = shared.sizes[key]
+                owned.currbytes += shared.sizes[key]
+
+        self.shared, self.generation = owned, 0
+        return owned
+
+    def __getstate__(self):
+        self.own()
+        return self.__dict__
+
+    def __getitem__(self, key): return self.entries[key]
+
+    def __setitem__(self, key, value): self.put(key, value)
+
+    def put(self, key, value, size=None):
+        '''
+        Store `value` for `key`; when bytes are bounded, the entry's `size` is computed unless given.
+        '''
+        if key in self.entries: del self[key]
+        shared = self.shared
+        shared.entries[key], shared.generations[key] = value, self.generation
+        if self.maxbytes is not None: 
+            shared.sizes[key] = approximate_bytes(key) + approximate_bytes(value) if size is None else size
+            shared.currbytes += shared.sizes[key]
+        self.evict()
+
+    def __delitem__(self, key):
+        shared = self.own()
+        # earlier copies may see the entry, hence it's deleted from a storage of my own
+        if shared.generations[key] != self.generation: shared = self.own(detach=True)
+        del shared.entries[key], shared.generations[key]
+        shared.currbytes -= shared.sizes.pop(key, 0)
+
+    def __iter__(self): return iter(self.entries)
+
+    def __len__(self): return len(self.entries)
+
+    def __contains__(self, key): return key in self.entries
+
+    def __copy__(self): return self.copy()
+
+    def __repr__(self): return '{}({})'.format(type(self).__name__, dict(self.entries))
+
+    # the following are not inherited from `MutableMapping` because its views
+    # would access entries one at the time, through `__getitem__`.
+    def keys(self): return self.entries.keys()
+
+    def values(self): return self.entries.values()
+
+    def items(self): return self.entries.items()
+
+    def lookup(self, key, default=None):
+        '''
+        Return the entry for `key`, refreshing it as the most recently used one, or `default`.
+        '''
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.stats.misses += 1
+            count('{} misses'.format(self.name))
+            return default
+
+        self.stats.hits += 1
+        count('{} hits'.format(self.name))
+        self.entries.move_to_end(key)
+        return value
+
+    def evict(self):
+        shared = self.own()
+        while shared.entries and self.exceeded():
+            key, _ = shared.entries.popitem(last=False)
+            del shared.generations[key]
+            shared.currbytes -= shared.sizes.pop(key, 0)
+            self.stats.evictions += 1
+
+    def exceeded(self):
+        return ((self.maxsize is not None and len(self.entries) > self.maxsize) or
+                (self.maxbytes is not None and self.currbytes > self.maxbytes))
+
+    def derive(self, items=()):
+        '''
+        Build a new cache holding `items`, with my same bounds and name and sharing my counters; sizes
+        of entries that I hold too, the very same value for the same key, are not computed again.
+
+        Examples
+        ========
+
+        >>> from sympy import IndexedBase, symbols
+        >>> f, n = IndexedBase('f'), symbols('n')
+        >>> cache = lru_terms_cache({f[n]: f[n-1] + f[n-2]}, maxbytes=1 << 20)
+        >>> cache.sizes[f[n]] = 1 # pretend a different size, to see it copied along
+        >>> cache.copy().sizes[f[n]], cache.derive({f[n]: f[n-2]}).sizes[f[n]] > 1
+        (1, True)
+        '''
+        derived = lru_terms_cache(maxsize=self.maxsize, maxbytes=self.maxbytes, stats=self.stats, name=self.name)
+        for key, value in (items.items() if isinstance(items, Mapping) else items):
+            same = self.maxbytes is not None and self.entries.get(key) is value
+            derived.put(key, value, self.sizes.get(key) if same else None)
+        return derived
+
+    def copy(self):
+        '''
+        Return a cache holding my entries, with my same bounds and name and sharing my counters,
+        that shares my storage too, taking its ownership over.
+
+        Examples
+        ========
+
+        >>> from sympy import IndexedBase, symbols
+        >>> f, n = IndexedBase('f'), symbols('n')
+        >>> cache = lru_terms_cache({f[n]: f[n-1] + f[n-2]})
+        >>> copied = cache.copy()
+        >>> copied[f[n-1]] = f[n-2] + f[n-3]
+        >>> copied.shared is cache.shared, len(copied), len(cache), copied.shared is cache.shared
+        (True, 2, 1, False)
+        >>> del copied[f[n]]
+        >>> sorted(copied, key=str), sorted(cache, key=str)
+        ([f[n - 1]], [f[n]])
+        '''
+        shared = self.own()
+        shared.latest += 1
+
+        copied = lru_terms_cache(maxsize=self.maxsize, maxbytes=self.maxbytes, stats=self.stats, name=self.name)
+        copied.shared, copied.generation = shared, shared.latest
+        return copied
+
+    def cache_info(self):
+        return CacheInfo(hits=self.stats.hits, misses=self.stats.misses, evictions=self.stats.evictions,
+                         maxsize=self.maxsize, maxbytes=self.maxbytes, currsize=len(self.entries),
+                         currbytes=self.currbytes if self.maxbytes is not None else None)
+
@@ -0,0 +1,94 @@
+
+from sympy import S, Add, expand
+
+from destructuring import *
+
+class linear_combination:
+    '''
+    Sparse representation of a term `c_0 * f[s_0] + c_1 * f[s_1] + ... + rest`.
+
+    I map each subscripts tuple `s_i` to its coefficient `c_i`, keeping everything not
+    indexed by `f` in `rest`; SymPy terms are built only when `as_expr` is requested,
+    therefore rewriting steps are dictionary operations.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> f, n = IndexedBase('f'), symbols('n')
+    >>> comb = linear_combination_of(f[n-1] + 2*(f[n-2] + 1) + f[n-1]/n, f)
+    >>> sorted(comb.items(), key=str)
+    [((n - 1,), 1 + 1/n), ((n - 2,), 2)]
+    >>> comb.rest
+    2
+    >>> comb.accumulate(comb.xreplace({n: n-1}), scale=-1)
+    >>> sorted(comb.items(), key=str)
+    [((n - 1,), 1 + 1/n), ((n - 2,), 1 - 1/(n - 1)), ((n - 3,), -2)]
+    >>> comb.rest
+    0
+    '''
+
+    def __init__(self, indexed, terms=None, rest=S.Zero):
+        self.indexed = indexed
+        self.terms = dict(terms or {})
+        self.rest = rest
+
+    def __len__(self): return len(self.terms)
+
+    def __repr__(self): return 'linear_combination({})'.format(self.as_expr())
+
+    def items(self): return self.terms.items()
+
+    def coefficient(self, subscripts): return self.terms.get(tuple(subscripts), S.Zero)
+
+    def add_term(self, coeff, subscripts):
+        '''
+        Add `coeff * f[subscripts]` to myself, in place; cancelling terms are dropped.
+        '''
+        key = tuple(subscripts)
+        coeff = self.terms.get(key, S.Zero) + coeff
+        if coeff == 0: self.terms.pop(key, None)
+        else: self.terms[key] = coeff
+
+    def accumulate(self, other, scale=S.One):
+        '''
+        Add `scale * other` to myself, in place.
+        '''
+        for subscripts, coeff in other.items(): self.add_term(scale * coeff, subscripts)
+        self.rest = self.rest + scale * other.rest
+
+    def xreplace(self, rule):
+        '''
+        Return a new combination where `rule` is applied to subscripts and coefficients.
+        '''
+        replaced = linear_combination(self.indexed, rest=self.rest.xreplace(rule))
+        for subscripts, coeff in self.items():
+            replaced.add_term(coeff.xreplace(rule), [s.xreplace(rule) for s in subscripts])
+        return replaced
+
+    def substitute(self, combinations):
+        '''
+        Return a new combination where each `f[s]` is replaced by `combinations[s]`, if given.
+        '''
+        substituted = linear_combination(self.indexed, rest=self.rest)
+        for subscripts, coeff in self.items():
+            if subscripts in combinations: substituted.accumulate(combinations[subscripts], scale=coeff)
+            else: substituted.add_term(coeff, subscripts)
+        return substituted
+
+    def as_expr(self):
+        summands = [coeff * self.indexed[subscripts] for subscripts, coeff in self.items()]
+        return Add(*(summands + [self.rest]))
+
+def linear_combination_of(term, indexed):
+    '''
+    Read `term`, once expanded, as a `linear_combination` of terms indexed by `indexed`.
+    '''
+
+    combination = linear_combination(indexed)
+    with bind_Add_indexed(expand(term), indexed) as (destructured, others):
+        for coeff, subscripts in destructured: combination.add_term(coeff, subscripts)
+        combination.rest = Add(*others)
+
+    return combination
+
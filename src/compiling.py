@@ -0,0 +1,74 @@
+
+from destructuring import *
+from equations import *
+from combinations import *
+from profiling import phase
+
+class compiled_recurrence:
+    '''
+    A recurrence prepared once to be used as a rewriting rule many times.
+
+    I hold the normal form of the given recurrence, where the `lhs` subscripts are vanilla
+    indexes, the inverses of the affine relations of the original `lhs` subscripts and the
+    coefficient of the `lhs` in normal form; therefore, rewriting a term `coeff * f[i j ...]`
+    requires just a simultaneous replacement of indexes, no `solve` nor pattern matching
+    on the recurrence itself.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> f, n = IndexedBase('f'), symbols('n')
+    >>> compiled = compiled_recurrence(Eq(f[n+2], f[n+1] + f[n]), f, [n])
+    >>> compiled.normalized_eq == Eq(f[n], f[n-1] + f[n-2])
+    True
+    >>> compiled.unfold(3, [n-1]) == 3*f[n-2] + 3*f[n-3]
+    True
+    '''
+
+    def __init__(self, recurrence_eq, indexed, index):
+        self.recurrence_eq = recurrence_eq
+        self.indexed = indexed
+        self.index = index
+
+        with phase('normal form'):
+            with bind_Mul_indexed(recurrence_eq.lhs, indexed) as (_, subscripts):
+                self.inverses = invert_subscripts(zip(index, subscripts))
+
+            normalized_eq = recurrence_eq
+            for var, (d, sol) in self.inverses.items():
+                normalized_eq = normalized_eq.subs(var, sol).subs(d, var)
+            self.normalized_eq = normalized_eq
+
+        with bind_Mul_indexed(normalized_eq.lhs, indexed) as (lhs_coeff, _):
+            self.lhs_coeff = lhs_coeff
+
+        self.rhs_combination = None
+
+    def instantiate(self, subscripts):
+        '''
+        Return the normal form where indexes are replaced by `subscripts`, simultaneously.
+        '''
+        return self.normalized_eq.xreplace(dict(zip(self.index, subscripts)))
+
+    def unfold(self, coeff, subscripts):
+        '''
+        Return the rewriting of the term `coeff * f[subscripts]` according to the recurrence.
+        '''
+        constraints = dict(zip(self.index, subscripts))
+        instantiated_rhs = self.normalized_eq.rhs.xreplace(constraints)
+        coeff_lhs = self.lhs_coeff.xreplace(constraints)
+
+        # if coeff == coeff_lhs then we've a perfect match for unfolding
+        return instantiated_rhs * (coeff/coeff_lhs)
+
+    def unfold_combination(self, subscripts):
+        '''
+        Return the rewriting of the term `f[subscripts]` as a `linear_combination`.
+        '''
+        if self.rhs_combination is None:
+            self.rhs_combination = linear_combination_of(
+                self.normalized_eq.rhs / self.lhs_coeff, self.indexed)
+
+        return self.rhs_combination.xreplace(dict(zip(self.index, subscripts)))
+
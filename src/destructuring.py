@@ -1,7 +1,9 @@
 
-from sympy import Wild, Indexed
+from sympy import Wild, Indexed, Mul, Add, Atom, S, flatten
 from contextlib import contextmanager
 
+from profiling import phase
+
 class DestructuringError(ValueError): 
     '''
     Represent an error due to the impossibility to destructure a given term.
@@ -56,6 +58,63 @@ def bind_Mul_indexed(term, indexed, forbidden_terms=[]):
     something else
     '''
 
+    with phase('destructuring'):
+        destructured = destructure_Mul_indexed(term, indexed, forbidden_terms)
+    yield destructured
+
+def destructure_Mul_indexed(term, indexed, forbidden_terms=[]):
+    '''
+    Return the pair `(coeff, subscripts)` such that `term == coeff * indexed[subscripts]`.
+
+    I look at the factors of `term` directly, expecting exactly one of them to be indexed
+    by `indexed` and no other one to mention neither `indexed` nor a term in `forbidden_terms`;
+    only when such structural reading is inconclusive I resort to pattern matching, 
+    which is the slow path. If destructuring fails, then I raise `DestructuringError`.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> f, g, n, k = IndexedBase('f'), IndexedBase('g'), *symbols('n k')
+    >>> destructure_Mul_indexed(f[n, k], f)
+    (1, [n, k])
+    >>> destructure_Mul_indexed(g[k]*f[n-1]/(n+1), f)
+    (g[k]/(n + 1), [n - 1])
+    >>> destructure_Mul_indexed(f[n]**2, f)
+    Traceback (most recent call last):
+    ...
+    destructuring.DestructuringError
+    >>> destructure_Mul_indexed(3*g[n], f)
+    Traceback (most recent call last):
+    ...
+    destructuring.DestructuringError
+    '''
+
+    if isinstance(term, Indexed) and term.base == indexed: return S.One, list(term.indices)
+    elif isinstance(term, (Atom, Indexed)): raise DestructuringError()
+    elif isinstance(term, Mul):
+
+        indexed_factors, coeff_factors = [], []
+        for factor in term.args:
+            if isinstance(factor, Indexed) and factor.base == indexed: indexed_factors.append(factor)
+            else: coeff_factors.append(factor)
+
+        coeff_mentions = lambda t: any(factor.has(t) for factor in coeff_factors)
+
+        if not indexed_factors and not coeff_mentions(indexed): raise DestructuringError()
+        elif (len(indexed_factors) == 1 
+              and not coeff_mentions(indexed) 
+              and not any(coeff_mentions(t) for t in forbidden_terms)):
+            indexed_factor, = indexed_factors
+            return Mul(*coeff_factors), list(indexed_factor.indices)
+
+    return destructure_Mul_indexed_by_matching(term, indexed, forbidden_terms)
+
+def destructure_Mul_indexed_by_matching(term, indexed, forbidden_terms=[]):
+    '''
+    Same as `destructure_Mul_indexed` but using `Wild` objects and `match`, in any case.
+    '''
+
     coeff_w, ind_w = Wild('coeff', exclude=[indexed] + forbidden_terms), Wild('ind')
     matched = term.match(coeff_w * ind_w)
     # if no indexing applied then `isinstance(matched[ind_w], IndexedBase)` holds
@@ -64,9 +123,36 @@ def bind_Mul_indexed(term, indexed, forbidden_terms=[]):
         and coeff_w in matched 
         and isinstance(matched[ind_w], Indexed)):
         _, *subscripts = matched[ind_w].args
-        yield matched[coeff_w], subscripts # do not splice subscripts, give them packed
+        return matched[coeff_w], subscripts # do not splice subscripts, give them packed
     else:
         raise DestructuringError()
 
+@contextmanager
+def bind_Add_indexed(term, indexed, forbidden_terms=[]):
+    '''
+    Destructure each summand of `term` against pattern `coeff * f[i j ...]`, in one pass.
+
+    Nested `Add` objects (as the unevaluated ones built while unfolding) are flattened, then
+    I bind a pair `(destructured, others)`, where `destructured` is a list of pairs 
+    `(coeff, subscripts)`, one for each summand that can be destructured by 
+    `destructure_Mul_indexed`, while `others` collects the remaining summands.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> f, n = IndexedBase('f'), symbols('n')
+    >>> term = Add(f[n-1], Add(3*f[n-2], 2/n, evaluate=False), evaluate=False)
+    >>> with bind_Add_indexed(term, f) as (destructured, others):
+    ...     print(destructured, others)
+    [(1, [n - 1]), (3, [n - 2])] [2/n]
+    '''
 
+    destructured, others = [], []
+    for summand in (flatten(term.args, cls=Add) if isinstance(term, Add) else [term]):
+        try:
+            destructured.append(destructure_Mul_indexed(summand, indexed, forbidden_terms))
+        except DestructuringError:
+            others.append(summand)
 
+    yield destructured, others
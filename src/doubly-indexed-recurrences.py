@@ -1,10 +1,19 @@
 
 from utils import * 
+from terms import *
+from storage import *
+from profiling import *
+from telemetry import *
+from typesetting import *
+from stencils import *
+from verifying import random_mismatch
+from equations import solve_linear_sparse
+from combinations import linear_combination
 
 from sympy import *
 from sympy.abc import x, n, z, t, k
 from sympy.core.cache import *
-from sympy.core.function import UndefinedFunction
+from sympy.core.function import UndefinedFunction, AppliedUndef
 from sympy.printing.latex import latex
 
 from functools import reduce
@@ -40,8 +49,10 @@ class IndexingGenericElementVisitor:
         self.ge = ge
 
     def __call__(self, *indexes):
+        # `indexes` are dropped afterwards, so my state, as `canonical_repr` sees it, is `ge` only
         self.indexes = indexes
-        return self.ge.accept(self)
+        try: return self.ge.accept(self)
+        finally: del self.indexes
 
     def forIndexedBaseGenericElement(self, ibge): return ibge[self.indexes]
 
@@ -59,7 +70,7 @@ def make_generic_element(generic_term):
                     " are accepted to build abstract A-sequences.")
 
 def symbolic_matrix(dims, gen_coeff_symbol, inits={}, 
-                    lower=True, return_full_matrix_spec=True, diagonal_col_offset=None):
+                    lower=True, return_full_matrix_spec=True, diagonal_col_offset=None, lazy=False):
 
     if diagonal_col_offset is None: diagonal_col_offset = 1
 
@@ -69,12 +80,161 @@ def symbolic_matrix(dims, gen_coeff_symbol, inits={},
     ge = make_generic_element(gen_coeff_symbol)
     indexer = IndexingGenericElementVisitor(ge)
 
+    if lazy:
+        # `inits` are an overlay of entries, instead of a `Subs` object wrapping the whole matrix
+        m = LazySymbolicMatrix(dims, indexer, triangular=[(diagonal_col_offset, 1)] if lower else [])
+        for sym_coeff, v in inits.items(): m.assign_generic_entry(sym_coeff, v)
+        return (m, gen_coeff_symbol) if return_full_matrix_spec else m
+
     m = Matrix(*dims, lambda n,k: 0 if lower and n*diagonal_col_offset < k else indexer(n,k))
     for sym_coeff, v in inits.items(): m = Subs(m.subs(sym_coeff, v), sym_coeff, v)
     return (m, gen_coeff_symbol) if return_full_matrix_spec else m
 
+class LazySymbolicMatrix:
+    '''
+    A matrix of generic coefficients, as `symbolic_matrix` builds, whose entries are
+    created on access: I store only entries that differ from generic coefficients, namely
+    `inits` and assigned ones, while entries `(r, c)` such that `c >= slope*r + offset`,
+    for some pair `(slope, offset)` in `triangular`, are zeros and are stored neither.
+
+    Unfoldings require `rows`, `cols`, `copy`, `row` and indexing by `(r, c)` only; arithmetic,
+    iteration, comparisons, `subs`, `xreplace` and `applyfunc` are performed on the SymPy `Matrix`
+    that `as_matrix` builds, and so are their results, therefore conversions happen only when
+    SymPy's machinery is needed. Any other method is looked up in `as_matrix()` explicitly.
+
+    Examples
+    ========
+
+    >>> m = IndexedBase('m')
+    >>> lazy = symbolic_matrix((3, 3), m, inits={m[0,0]: 1}, lazy=True)[0]
+    >>> Matrix(lazy).shape, len(lazy.entries)
+    ((3, 3), 1)
+    >>> lazy * eye(3) == lazy.as_matrix() == eye(3) * lazy
+    True
+    >>> (lazy**2)[1, 0]
+    m[1, 0]*m[1, 1] + m[1, 0]
+    >>> symbolic_matrix((3, 3), m, inits={Symbol('a'): 1}, lazy=True)
+    Traceback (most recent call last):
+    ...
+    ValueError: `a` is not a generic coefficient with two integer indexes.
+    '''
+
+    # greater than `Matrix._op_priority`, so that SymPy defers to my reflected operators
+    _op_priority = 11
+
+    def __init__(self, dims, indexer, entries={}, triangular=[]):
+        self.rows, self.cols = dims
+        self.indexer = indexer
+        self.entries = dict(entries)
+        self.triangular = list(triangular)
+
+    @property
+    def shape(self): return self.rows, self.cols
+
+    def cell(self, key):
+        r, c = (int(i) for i in key)
+        if r < 0: r += self.rows
+        if c < 0: c += self.cols
+        if not (0 <= r < self.rows and 0 <= c < self.cols): 
+            raise IndexError('Index {} is out of a {}x{} matrix.'.format(key, self.rows, self.cols))
+        return r, c
+
+    def is_zero_entry(self, r, c):
+        return any(c >= slope*r + offset for slope, offset in self.triangular)
+
+    def generic_entry(self, r, c):
+        return S.Zero if self.is_zero_entry(r, c) else self.indexer(r, c)
+
+    def __getitem__(self, key):
+
+        if not (isinstance(key, tuple) and all(isinstance(i, (int, Integer)) for i in key)):
+            return self.as_matrix()[key]
+
+        r, c = self.cell(key)
+        entry = self.entries.get((r, c))
+        return self.generic_entry(r, c) if entry is None else entry
+
+    def __setitem__(self, key, value):
+
+        r, c = self.cell(key)
+        value = sympify(value)
+        if value == self.generic_entry(r, c): self.entries.pop((r, c), None)
+        else: self.entries[r, c] = value
+
+    def assign_generic_entry(self, generic_coeff, value):
+        '''
+        Assign `value` to the entry whose generic coefficient is `generic_coeff`, if any;
+        `generic_coeff` has to be an `Indexed` or an applied function with two integer indexes.
+        '''
+        indexes = (generic_coeff.indices if isinstance(generic_coeff, Indexed) else
+                   generic_coeff.args if isinstance(generic_coeff, AppliedUndef) else ())
+        if len(indexes) != 2 or not all(i.is_Integer for i in indexes):
+            raise ValueError('`{}` is not a generic coefficient with two integer indexes.'.format(generic_coeff))
+
+        r, c = indexes
+        if r < self.rows and c < self.cols and self.generic_entry(r, c) == generic_coeff: self[r, c] = value
+
+    def copy(self): 
+        return LazySymbolicMatrix(self.shape, self.indexer, self.entries, self.triangular)
+
+    def lower_triangular(self, column_offset):
+        '''
+        Return a copy of myself where entries `(r, c)` such that `c >= r + column_offset` are zeros.
+        '''
+        triangular = self.triangular + [(1, column_offset)]
+        entries = {(r, c):v for (r, c), v in self.entries.items() if c < r + column_offset}
+        return LazySymbolicMatrix(self.shape, self.indexer, entries, triangular)
+
+    def row(self, r): return Matrix([[self[r, c] for c in range(self.cols)]])
+
+    def as_matrix(self): return Matrix(self.rows, self.cols, lambda r, c: self[r, c])
+
+    def _sympy_(self): return ImmutableMatrix(self.as_matrix())
+
+    def __array__(self, dtype=object, copy=None):
+        from sympy.matrices.dense import matrix2numpy
+        return matrix2numpy(self.as_matrix(), dtype)
+
+    def __len__(self): return self.rows * self.cols
+
+    def __iter__(self): return (self[r, c] for r in range(self.rows) for c in range(self.cols))
+
+    def __eq__(self, other): return self.as_matrix() == other
+
+    __hash__ = None
+
+    def __neg__(self): return -self.as_matrix()
+
+    def __add__(self, other): return self.as_matrix() + other
+
+    def __radd__(self, other): return other + self.as_matrix()
+
+    def __sub__(self, other): return self.as_matrix() - other
+
+    def __rsub__(self, other): return other - self.as_matrix()
+
+    def __mul__(self, other): return self.as_matrix() * other
+
+    def __rmul__(self, other): return other * self.as_matrix()
+
+    def __matmul__(self, other): return self.as_matrix() @ other
+
+    def __rmatmul__(self, other): return other @ self.as_matrix()
+
+    def __pow__(self, exp): return self.as_matrix() ** exp
+
+    def subs(self, *args, **kwds): return self.as_matrix().subs(*args, **kwds)
+
+    def xreplace(self, rule): return self.as_matrix().xreplace(rule)
+
+    def applyfunc(self, f): return self.as_matrix().applyfunc(f)
+
+    def __repr__(self): return repr(self.as_matrix())
+
+
 def make_lower_triangular(m_spec, column_offset=1):
     m, generic_sym = m_spec
+    if isinstance(m, LazySymbolicMatrix): return m.lower_triangular(column_offset), generic_sym
     m = m.copy()
     for r in range(m.rows):
         for c in range(r + column_offset, m.cols):
@@ -104,8 +264,8 @@ class Zsequence(AbstractSequence):
         assert c == 0 and col_sym_index == 0, "c:{0}, col:{1}".format(c, col_sym_index)
 
         row_eq = Eq(row_sym_index,r)
-        row_sol = solve(row_eq, row_sym)[0]
-        return self.rec.subs(row_sym, row_sol)
+        with phase('solve'): row_sol = solve(row_eq, row_sym)[0]
+        with phase('subs'): return self.rec.subs(row_sym, row_sol)
 
     def accept(self, visitor): return visitor.forZsequence(self)
 
@@ -120,8 +280,8 @@ class Asequence(AbstractSequence):
         indexed_sym, row_sym_index, col_sym_index = self.rec.lhs.args
 
         row_eq, col_eq = Eq(row_sym_index,r), Eq(col_sym_index,c)
-        row_sol, col_sol = (solve(row_eq, row_sym)[0], solve(col_eq, col_sym)[0])
-        return self.rec.subs({row_sym: row_sol, col_sym:col_sol}, simultaneous=True)
+        with phase('solve'): row_sol, col_sol = (solve(row_eq, row_sym)[0], solve(col_eq, col_sym)[0])
+        with phase('subs'): return self.rec.subs({row_sym: row_sol, col_sym:col_sol}, simultaneous=True)
 
     def accept(self, visitor): return visitor.forAsequence(self)
 
@@ -174,7 +334,7 @@ class MaxColumnSubscriptVisitor:
                                         simultaneous=True)  
         
         max_col_subscript = self.col_subscript(instantiated_rec.lhs)
-        for rhs_term in explode_term_respect_to(instantiated_rec.rhs, op_class=Add):
+        for rhs_term in explode_term_respect_to(instantiated_rec.rhs, cls=Add):
             current_col_subscript = self.col_subscript(rhs_term)
             if current_col_subscript is None: continue
             max_col_subscript = max(max_col_subscript, current_col_subscript)
@@ -368,17 +528,22 @@ def make_A_Z_sequences_from_recs(Arec, Zrec=None):
     Zseq = Aseq if Zrec is None else Zsequence(Zrec)
     return Aseq, Zseq
 
+@profiled('unfold_in_matrix')
 def unfold_in_matrix(m_spec, Arec, Zrec=None,
             unfold_row_start_index=1, unfolding_rows=None, diagonal_col_offset=None,
             unfold_col_start_index=None, row_sym=Symbol('n'), col_sym=Symbol('k'),
             include_substitutions=False, free_vars_location=OnColumnZeroFreeVarsLocation(),
-            adjust_end_column_index=NullAdjustEndColumnIndexVisitor()):
+            adjust_end_column_index=NullAdjustEndColumnIndexVisitor(), telemetry=None):
 
     m, indexed_sym = m_spec
     m = m.copy()
 
     Aseq, Zseq = make_A_Z_sequences_from_recs(Arec, Zrec)
 
+    # shift invariant recurrences are applied as stencils, otherwise they're matched cell by cell
+    stencils = {Aseq: compile_stencil(Arec, indexed_sym, row_sym, col_sym)}
+    if Zseq is not Aseq: stencils[Zseq] = compile_stencil(Zrec, indexed_sym, row_sym, col_sym, first_column=True)
+
     if unfolding_rows is None: unfolding_rows = m.rows
     if diagonal_col_offset is None: diagonal_col_offset = 1
     if unfold_col_start_index is None: unfold_col_start_index = 0
@@ -393,35 +558,43 @@ def unfold_in_matrix(m_spec, Arec, Zrec=None,
 
         for c in range(unfold_col_start_index, cols):
 
-            instantiated_rec = sequence.instantiate((row_sym, r), (col_sym, c))
+            compiled = stencils[sequence]
+            if compiled is not None: unfold_term = compiled.apply(m, r, c)
+            else:
+                instantiated_rec = sequence.instantiate((row_sym, r), (col_sym, c))
 
-            unfold_term = 0
+                unfold_term = 0
 
-            for summand in explode_term_respect_to(instantiated_rec.rhs, Add):
-                coeff_wild = Wild('coeff', exclude=[indexed_sym])
-                row_wild = Wild('n', exclude=[indexed_sym])
-                col_wild = Wild('k', exclude=[indexed_sym])
-                matched = summand.match(coeff_wild * indexed_sym[row_wild, col_wild])
+                for summand in explode_term_respect_to(instantiated_rec.rhs, Add):
+                    coeff_wild = Wild('coeff', exclude=[indexed_sym])
+                    row_wild = Wild('n', exclude=[indexed_sym])
+                    col_wild = Wild('k', exclude=[indexed_sym])
+                    with phase('destructuring'): matched = summand.match(coeff_wild * indexed_sym[row_wild, col_wild])
 
-                if  not matched or \
-                    coeff_wild not in matched or \
-                    row_wild not in matched or \
-                    col_wild not in matched: 
-                    continue
+                    if  not matched or \
+                        coeff_wild not in matched or \
+                        row_wild not in matched or \
+                        col_wild not in matched: 
+                        continue
 
-                inst_row_index, inst_col_index = matched[row_wild], matched[col_wild]
-                coeff = matched[coeff_wild]
+                    inst_row_index, inst_col_index = matched[row_wild], matched[col_wild]
+                    coeff = matched[coeff_wild]
 
-                if inst_row_index in range(m.rows) and inst_col_index in range(m.cols):
-                    unfold_term = unfold_term + coeff * m[inst_row_index, inst_col_index]
+                    if inst_row_index in range(m.rows) and inst_col_index in range(m.cols):
+                        unfold_term = unfold_term + coeff * m[inst_row_index, inst_col_index]
 
             if c < m.cols: 
-                unfold_term = Poly(unfold_term, variables).args[0]
+                with phase('expand'): unfold_term = Poly(unfold_term, variables).args[0]
                 m[r,c] = unfold_term
                 substitutions.update({indexed_sym[r,c] : unfold_term})
 
             sequence = Aseq
 
+        if telemetry is not None: 
+            record = dict(row=r, terms_cache=len(substitutions))
+            record.update(expression_metrics(*m.row(r)))
+            telemetry(record)
+
     m_spec = m, indexed_sym
     return (m_spec, substitutions) if include_substitutions else m_spec
             
@@ -458,6 +631,7 @@ def unfold_upper_chunk(*args, **kwds):
     return  factorize_each_term_respect_free_variables_location(
                 matrix_spec, unfolding_rows, free_vars_location, substitutions)
 
+@profiled('invert_rec')
 def invert_rec( matrix_spec, Arec, Zrec=None, *args, unfolding_rows=None,
                 diagonal_col_offset=1, row_sym=Symbol('n'), col_sym=Symbol('k'), **kwds):
 
@@ -466,7 +640,7 @@ def invert_rec( matrix_spec, Arec, Zrec=None, *args, unfolding_rows=None,
 
     if unfolding_rows is None: unfolding_rows = matrix.rows
 
-    substitutions = []
+    systems = []
 
     for i in range(1, unfolding_rows):
         r = unfolding_rows-i
@@ -476,29 +650,63 @@ def invert_rec( matrix_spec, Arec, Zrec=None, *args, unfolding_rows=None,
             seq = Aseq if c > 0 else Zseq
             instantiated_rec = seq.instantiate((row_sym, r), (col_sym, c))
             eqs.append(instantiated_rec)
-             
-        sols = solve(eqs, check=True)
-        
-        assert len(sols) > 0, "r:{} provides no solutions".format(r)
 
-        sol = sols[0]
         previous_r = r-1
-        substitutions.append({term:sol[term] 
-            for c in range(previous_r * diagonal_col_offset + 1)
-            for term in [ indexed_sym[previous_r, c] ]})
-
-    backwards_substitutions = {}
-
-    for substitution in substitutions:
-        backwards_substitutions.update({k:v.subs(backwards_substitutions) for k,v in substitution.items()})
+        systems.append((r, eqs, [indexed_sym[previous_r, c] for c in range(previous_r * diagonal_col_offset + 1)]))
 
     find_max_subscript = MaxColumnSubscriptVisitor()
     cols = find_max_subscript(matrix_spec, Aseq, row_sym, col_sym)
     zero_subs = {indexed_sym[r,c]:0 for r in range(0, matrix.rows) for c in range(r+1, cols+1)}
-    backwards_substitutions = {k:v.subs(zero_subs) for k,v in backwards_substitutions.items()}
+
+    # each system is triangular by construction, so the sparse elimination is enough as long as
+    # coefficients are numbers; otherwise, `solve` is required and substitutions are chained by `subs`
+    backwards_substitutions = eliminate_backwards(systems, indexed_sym, zero_subs)
+    if backwards_substitutions is None: backwards_substitutions = solve_backwards(systems, zero_subs)
 
     return matrix_spec, backwards_substitutions
 
+def eliminate_backwards(systems, indexed_sym, zero_subs):
+
+    backwards_substitutions = {}
+
+    for r, eqs, terms in systems:
+
+        with phase('solve'): sol = solve_linear_sparse(eqs, indexed_sym)
+        if sol is None: return None
+
+        assert len(sol) > 0, "r:{} provides no solutions".format(r)
+
+        # solutions are linear combinations, composed once with the ones of the row below
+        with phase('subs'):
+            backwards_substitutions.update({term.indices:sol[term].substitute(backwards_substitutions) 
+                                            for term in terms})
+
+    with phase('subs'):
+        return {indexed_sym[subscripts]:linear_combination(indexed_sym, 
+                    {s:coeff for s, coeff in comb.items() if indexed_sym[s] not in zero_subs}, comb.rest).as_expr()
+                for subscripts, comb in backwards_substitutions.items()}
+
+def solve_backwards(systems, zero_subs):
+
+    substitutions = []
+
+    for r, eqs, terms in systems:
+
+        with phase('solve'): sols = solve(eqs, check=True)
+        
+        assert len(sols) > 0, "r:{} provides no solutions".format(r)
+
+        sol = sols if isinstance(sols, dict) else sols[0]
+        substitutions.append({term:sol[term] for term in terms})
+
+    backwards_substitutions = {}
+
+    with phase('subs'):
+        for substitution in substitutions:
+            backwards_substitutions.update({k:v.subs(backwards_substitutions) for k,v in substitution.items()})
+
+    with phase('subs'): return {k:v.subs(zero_subs) for k,v in backwards_substitutions.items()}
+
 def build_rec_from_A_matrix(A_matrix): pass
 
 def build_rec_from_A_sequence(A_sequence_spec, symbolic_row_index = Symbol('n')+1):
@@ -511,37 +719,33 @@ def extract_inner_matrices(m_spec, unfolding_rows, diagonal_col_offset=None, fre
     
     if diagonal_col_offset is None: diagonal_col_offset = 1
 
-    matrices = {}
-
     variables = free_variables_in_matrix(m_spec, unfolding_rows, free_vars_location)
 
-    for current_symbolic_element in variables:
-
-        nullable_variables = variables - set([current_symbolic_element])
-        substitutions = {var:0 for var in nullable_variables}
-
-        nullable_matrix = matrix.subs(substitutions, simultaneous=True)
-
-        def worker(r, c):
-
-            if r*diagonal_col_offset < c: return 0 
+    # each coefficient is read once, as a polynomial in free variables if it is, filling every matrix at once
+    gens = list(variables)
+    matrices = {var:zeros(matrix.rows, matrix.cols) for var in gens}
 
-            wild_coeff = Wild("coeff")
-            matched = nullable_matrix[r,c].match(wild_coeff*current_symbolic_element)
+    for r in range(matrix.rows):
+        for c in range(min(matrix.cols, r*diagonal_col_offset + 1)):
 
-            #if not matched or wild_coeff not in matched: print("r:{} c:{} not matched: {}".format(r,c,nullable_matrix[r,c]))
-            #if r==5 and c==1: print("5 1: {}".format(matched[wild_coeff]))
-            #if matched[wild_coeff] == 0: print("r:{} c:{} has 0 for {}".format(r,c,current_symbolic_element))
-            return matched[wild_coeff] if matched and wild_coeff in matched else 0
+            if not matrix[r,c].has(*gens): continue
 
-        matrices[current_symbolic_element] = Matrix(matrix.rows, matrix.cols, worker)
+            for var, coeff in linear_coefficients(matrix[r,c], gens).items(): matrices[var][r,c] = coeff
 
     return matrices
 
-def check_matrix_expansion(m_spec, expansion, inits={}, perform_asserts=True):
+def check_matrix_expansion(m_spec, expansion, inits={}, perform_asserts=True, trials=None):
 
     m, indexed_sym = m_spec
 
+    # if `trials` is given, both sides are evaluated at random points, without expanding them
+    if trials is not None:
+        sum_matrix = Matrix(m.rows, m.cols, lambda r, c: Add(*[k * v[r, c] for k,v in expansion.items()]))
+        cell = random_mismatch(m, sum_matrix, trials, substitutions=inits)
+        if cell is None: return True
+        if perform_asserts: assert False, "Row: {} Col: {} --- {} != {}".format(*cell, m[cell], sum_matrix[cell])
+        return False
+
     sum_matrix = zeros(m.rows, m.cols)
 
     for k,v in expansion.items(): sum_matrix = sum_matrix + (k * v)
@@ -585,7 +789,12 @@ def entail_dependencies(unfolded_matrix_spec, unfolding_rows, free_vars_location
     return visitor(unfolded_matrix_spec, unfolding_rows, free_vars_location)
 
 def factorize_matrix_as_matrices_sum(
-        matrix_spec, length=None, perform_check=False, *args, **kwds):
+        matrix_spec, length=None, perform_check=False, *args, store=None, check_trials=None, **kwds):
+
+    if store is not None:
+        key = fingerprint('factorize_matrix_as_matrices_sum', matrix_spec, length, perform_check, args, kwds)
+        return store.fetch(key, lambda: factorize_matrix_as_matrices_sum(
+            matrix_spec, length, perform_check, *args, check_trials=check_trials, **kwds))
     
     matrix = matrix_spec[0]
 
@@ -607,7 +816,8 @@ def factorize_matrix_as_matrices_sum(
     inits_dependencies = entail_dependencies(unfolded_matrix_spec, length, free_vars_location)
 
     if perform_check:
-        should_be_true = check_matrix_expansion(unfolded_matrix_spec, matrix_expansion, inits_dependencies)
+        should_be_true = check_matrix_expansion(
+            unfolded_matrix_spec, matrix_expansion, inits_dependencies, trials=check_trials)
         assert should_be_true == True
 
     return dict(unfolded=extract_inner_matrices(unfolded_matrix_spec, 1, diagonal_col_offset, free_vars_location), 
@@ -617,7 +827,7 @@ def factorize_matrix_as_matrices_sum(
                 dependencies=inits_dependencies,
                 generic_symbol=unfolded_matrix_spec[1])
 
-def instantiate_factorization(factorization, inits=None, perform_check=False):
+def instantiate_factorization(factorization, inits=None, perform_check=False, trials=None):
     
     gen_sym = factorization['generic_symbol']
 
@@ -634,6 +844,11 @@ def instantiate_factorization(factorization, inits=None, perform_check=False):
     if perform_check:
         for k,v in inst_factorization['unfolded'].items():
             checking_matrix = k*v
+            if trials is not None:
+                cell = random_mismatch(checking_matrix, inst_factorization['splitted'], trials)
+                assert cell is None, "Row: {} Col: {} --- {} != {}".format(
+                    *cell, checking_matrix[cell], inst_factorization['splitted'][cell])
+                continue
             for r in range(v.rows):
                 for c in range(v.cols):
                     v1 = checking_matrix[r,c].expand()
@@ -660,41 +875,21 @@ def free_variables_in_matrix(matrix_spec, unfolding_rows, free_vars_location):
     return free_vars_respect(matrix_spec, unfolding_rows, free_vars_location)
 
 def clean_up_zeros(matrix_spec, label="", colors={}, 
-                    environment="equation", cancel_zeros=True, diagonal_col_offset=None):
+                    environment="equation", cancel_zeros=True, diagonal_col_offset=None, stream=None):
 
     matrix, indexed_sym = matrix_spec
     if diagonal_col_offset is None: diagonal_col_offset = 1
 
-    tex_code = r"\begin{" + environment + r"}" + "\n" if environment else ""
-    tex_code += r"\left[\begin{array}{" + ('c' * matrix.cols) + r'}' + "\n"
-
-    for r in range(matrix.rows):
-        for c in range(matrix.cols):
-            
-            space = "" if c == 0 else " "
-
-            if r*diagonal_col_offset < c: coeff_str = ""
-            elif cancel_zeros: coeff_str = latex(matrix[r,c]) if matrix[r,c] != 0 else ""
-            else: coeff_str = latex(matrix[r,c])
-
-            if (r,c) in colors: coeff_str = r'\textcolor{' + colors[(r,c)] + r'}{' + coeff_str + "}"
-            tex_code += "{}{} {}".format(space, coeff_str, r'\\' if c == matrix.cols-1 else r'&') 
-
-        tex_code += "" if r == matrix.rows - 1 else "\n"
-
-    label = "\n{}".format(r'\label{eq:' + label + r'}' + "\n" if label else "")
-    tex_code += "\n" + r'\end{array}\right]' 
-    tex_code += label + r'\end{' + environment + '}' if environment else ""
+    kwds = dict(label=label, colors=colors, environment=environment, 
+                cancel_zeros=cancel_zeros, diagonal_col_offset=diagonal_col_offset)
 
-    return tex_code
+    # rows are written one by one in `stream`, if given, otherwise the whole source is returned
+    if stream is not None: return write_latex_matrix(stream, matrix, **kwds)
+    return latex_to_string(write_latex_matrix, matrix, **kwds)
 
-def latex_of_matrix_expansion(matrix_expansion, *args, **kwds):
-    tex_code = ""
-    add_code = " + "
-    for k,v in matrix_expansion.items():
-        tex_code += latex(k) + clean_up_zeros((v, None), *args, environment=None, **kwds)
-        tex_code += add_code
-    return tex_code[0:-len(add_code)]
+def latex_of_matrix_expansion(matrix_expansion, *args, stream=None, **kwds):
+    if stream is not None: return write_latex_matrix_expansion(stream, matrix_expansion, *args, **kwds)
+    return latex_to_string(write_latex_matrix_expansion, matrix_expansion, *args, **kwds)
 
 
 class PascalHockeyStick:
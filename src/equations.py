@@ -1,6 +1,10 @@
 
 from contextlib import contextmanager
-from sympy import Dummy, solve, Eq
+from sympy import Dummy, Indexed, S, solve, Eq, default_sort_key
+
+from profiling import phase
+from combinations import linear_combination, linear_combination_of
+from destructuring import DestructuringError
 
 @contextmanager
 def isolated_lhs_normal_form(eq, subscripts_rel):
@@ -29,14 +33,27 @@ def isolated_lhs_normal_form(eq, subscripts_rel):
 
     '''
 
-    normalized = eq
-    for var, comb in subscripts_rel.items():
-        d = Dummy()
-        sol = solve(Eq(comb, d), var).pop()
-        normalized = normalized.subs(var, sol).subs(d, var)
+    with phase('normal form'):
+        normalized = eq
+        for var, (d, sol) in invert_subscripts(subscripts_rel).items():
+            normalized = normalized.subs(var, sol).subs(d, var)
 
     yield normalized
 
+def invert_subscripts(subscripts_rel):
+    '''
+    Invert each subscript relation `var -> comb`, solving `comb = d` for `var` with a fresh `Dummy` `d`.
+
+    I return a dictionary mapping each `var` to the pair `(d, sol)`, where `sol` depends on `d`.
+    '''
+
+    inverses = {}
+    for var, comb in dict(subscripts_rel).items():
+        d = Dummy()
+        with phase('solve'): inverses[var] = d, solve(Eq(comb, d), var).pop()
+
+    return inverses
+
 @contextmanager
 def instantiate_eq(eq, constraints):
     '''
@@ -46,7 +63,110 @@ def instantiate_eq(eq, constraints):
     is possible using the capabilities of `subs`, namely:
         `eq.subs(constraints, simultaneous=True)`
     '''
-    instantiated = eq
-    for var, rel in constraints.items():
-        instantiated = instantiated.subs(var, rel)
+    with phase('instantiate_eq'):
+        instantiated = eq
+        for var, rel in constraints.items():
+            instantiated = instantiated.subs(var, rel)
     yield instantiated
+
+def solve_linear_sparse(eqs, indexed):
+    '''
+    Solve `eqs`, a list of `Eq` objects linear in terms indexed by `indexed`, with numeric
+    coefficients, returning the same solutions that `solve(eqs)` does, each one as a
+    `linear_combination`; if some equation is not of that kind, `None` is returned.
+
+    I mimic the Gaussian elimination of `solve_linear_system`, hence unknowns are sorted
+    by `default_sort_key` and, if an equation has no pivot in the current column, columns
+    are swapped; however, equations are kept as sparse combinations of exact numbers, so
+    neither dense matrices nor `simplify` are involved. Unsolvable systems give `{}`.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> m = IndexedBase('m')
+    >>> eqs = [Eq(m[2,0], m[1,-1] + m[1,0]), Eq(m[2,1], m[1,0] + m[1,1]), Eq(m[2,2], m[1,1] + m[1,2])]
+    >>> sols = solve_linear_sparse(eqs, m)
+    >>> {k:v.as_expr() for k, v in sols.items()} == solve(eqs)
+    True
+    >>> sols[m[1,0]]
+    linear_combination(m[1, 2] + m[2, 1] - m[2, 2])
+    >>> solve_linear_sparse([Eq(m[1,0], m[0,0]**2)], m) is None
+    True
+
+    Rows of Catalan, Motzkin and Schroeder triangles, defined by their A and Z sequences,
+    give the same solutions as `solve`, also when columns are swapped to find pivots:
+    >>> def row_system(A, Z, r):
+    ...     eqs = [Eq(m[r, 0], sum(z*m[r-1, j] for j, z in enumerate(Z)))]
+    ...     return eqs + [Eq(m[r, c], sum(a*m[r-1, c-1+j] for j, a in enumerate(A))) for c in range(1, r+1)]
+    >>> triangles = [([1, 1, 1, 1], [1, 1, 1]), ([1, 1, 1], [1, 1]), ([1, 2, 2, 2], [2, 2, 2])]
+    >>> all({k:v.as_expr() for k, v in solve_linear_sparse(row_system(A, Z, r), m).items()} 
+    ...         == solve(row_system(A, Z, r)) for A, Z in triangles for r in range(2, 6))
+    True
+    >>> motzkin = solve_linear_sparse(row_system([1, 1, 1], [1, 1], 4), m)
+    >>> sorted(motzkin, key=default_sort_key)
+    [m[3, 0], m[3, 1], m[3, 2], m[3, 3], m[3, 5]]
+    >>> motzkin[m[3, 3]]
+    linear_combination(-m[3, 4] + m[4, 0] - m[4, 1] + m[4, 3])
+    '''
+
+    eqs = [eq for eq in eqs if eq is not S.true]
+    if any(eq is S.false for eq in eqs): return {}
+
+    try:
+        rows = [linear_combination_of(eq.lhs - eq.rhs, indexed) for eq in eqs]
+    except DestructuringError:
+        return None
+
+    if not all(row.rest.is_Number and all(coeff.is_Number for _, coeff in row.items()) for row in rows):
+        return None
+
+    syms = sorted(set().union(*[eq.free_symbols for eq in eqs]), key=default_sort_key)
+    position = {sym:p for p, sym in enumerate(syms)}
+
+    def coefficient(row, sym):
+        if isinstance(sym, Indexed) and sym.base == indexed: return row.coefficient(sym.indices)
+        return S.Zero
+
+    # each equation `row` reads `row.as_expr() = 0`, so `-row.rest` is its constant term
+    i = 0
+    while i < len(rows):
+
+        if i == len(syms):
+            if any(row.rest for row in rows[i:]): return {}
+            del rows[i:]
+            break
+
+        row = rows[i]
+        if not coefficient(row, syms[i]):
+            columns = [position[indexed[subscripts]] for subscripts, _ in row.items()]
+            if not columns:
+                if row.rest: return {}
+                del rows[i]
+                if not rows: return {}
+                continue
+            k = min(columns)
+            syms[i], syms[k] = syms[k], syms[i]
+            position[syms[i]], position[syms[k]] = i, k
+
+        normalized = linear_combination(indexed)
+        normalized.accumulate(row, scale=1/coefficient(row, syms[i]))
+        rows[i] = normalized
+
+        for below in rows[i+1:]:
+            coeff = coefficient(below, syms[i])
+            if coeff: below.accumulate(normalized, scale=-coeff)
+
+        i += 1
+
+    solutions = {}
+    for k in reversed(range(i)):
+        solution = linear_combination(indexed, rest=-rows[k].rest)
+        for subscripts, coeff in rows[k].items():
+            p = position[indexed[subscripts]]
+            if p == k: continue
+            elif p < i: solution.accumulate(solutions[syms[p]], scale=-coeff)
+            else: solution.add_term(-coeff, subscripts)
+        solutions[syms[k]] = solution
+
+    return solutions
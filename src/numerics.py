@@ -0,0 +1,183 @@
+
+from collections import defaultdict
+from fractions import Fraction
+
+from sympy import Integer, sympify
+
+def exact_number(term):
+    '''
+    Convert a SymPy rational `term` to an `int` or a `Fraction`, otherwise raise `ValueError`.
+
+    Examples
+    ========
+
+    >>> from sympy import Rational, Symbol
+    >>> exact_number(Rational(6, 3)), exact_number(Rational(-1, 4))
+    (2, Fraction(-1, 4))
+    >>> exact_number(Symbol('n'))
+    Traceback (most recent call last):
+    ...
+    ValueError: n is not a rational number, instantiate every index before.
+    '''
+    term = sympify(term)
+    if term.is_Integer: return int(term)
+    elif term.is_Rational: return Fraction(int(term.p), int(term.q))
+    raise ValueError('{} is not a rational number, instantiate every index before.'.format(term))
+
+def exact_subscripts(subscripts):
+    return tuple(exact_number(s) for s in subscripts)
+
+class numeric_rule:
+    '''
+    A `compiled_recurrence` evaluated on concrete subscripts, with exact arithmetic.
+
+    Calling me on a tuple of integer subscripts `s` returns the pair `(terms, rest)`, where
+    `terms` is the list of pairs `(subscripts, coeff)` such that `f[s]` rewrites to
+    `sum(coeff * f[subscripts]) + rest`; results are memoized per subscripts.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> from compiling import compiled_recurrence
+    >>> f, n = IndexedBase('f'), symbols('n')
+    >>> rule = numeric_rule(compiled_recurrence(Eq(f[n], f[n-1] + f[n-2]), f, [n]))
+    >>> rule.shift_invariant, sorted(rule((10,))[0])
+    (True, [((8,), 1), ((9,), 1)])
+    >>> from itertools import islice
+    >>> unfoldings = numeric_unfold_iter(rule, ({(10,): 1}, 0))
+    >>> sorted(next(islice(unfoldings, 3, None))[0].items())
+    [((4,), 1), ((5,), 3), ((6,), 3), ((7,), 1)]
+    '''
+
+    def __init__(self, compiled):
+        self.index = compiled.index
+        self.template = compiled.unfold_combination(compiled.index)
+        self.memo = {}
+
+        # `offsets` are available if each rhs subscript is an index plus an integer; moreover,
+        # the rule is `shift_invariant` if coefficients do not depend on indexes, so rewritings 
+        # can be computed by offsets only.
+        self.offsets = []
+        for subscripts, coeff in self.template.items():
+            offsets = [s - var for s, var in zip(subscripts, self.index)]
+            if not all(o.is_Integer for o in offsets): 
+                self.offsets = None
+                break
+            self.offsets.append((tuple(int(o) for o in offsets), coeff))
+
+        self.shift_invariant = (self.offsets is not None 
+                                and not any(coeff.free_symbols for _, coeff in self.offsets)
+                                and not self.template.rest.free_symbols)
+
+    def __call__(self, subscripts):
+
+        if subscripts not in self.memo and self.shift_invariant:
+            terms = [(tuple(s + o for s, o in zip(subscripts, offsets)), exact_number(coeff)) 
+                     for offsets, coeff in self.offsets]
+            self.memo[subscripts] = terms, exact_number(self.template.rest)
+        elif subscripts not in self.memo:
+            concrete = self.template.xreplace(dict(zip(self.index, map(Integer, subscripts))))
+            terms = [(exact_subscripts(s), exact_number(coeff)) for s, coeff in concrete.items()]
+            self.memo[subscripts] = terms, exact_number(concrete.rest)
+
+        return self.memo[subscripts]
+
+def numeric_combination(combination, substitutions={}):
+    '''
+    Instantiate a `linear_combination` by `substitutions`, returning the pair `(terms, rest)`
+    where `terms` is a dictionary from integer subscripts to exact coefficients.
+    '''
+    concrete = combination.xreplace(substitutions)
+    terms = {exact_subscripts(s): exact_number(coeff) for s, coeff in concrete.items()}
+    return terms, exact_number(concrete.rest)
+
+def numeric_unfold_iter(rule, combination):
+    '''
+    Yield the pairs `(terms, rest)` of first order unfoldings at depths `0, 1, 2, ...` of
+    `combination`, a pair as the one returned by `numeric_combination`, according to `rule`.
+    '''
+
+    terms, rest = combination
+    while True:
+        yield terms, rest
+
+        unfolded, unfolded_rest = defaultdict(int), rest
+        for subscripts, coeff in terms.items():
+            rewritten_terms, rewritten_rest = rule(subscripts)
+            for rewritten_subscripts, rewritten_coeff in rewritten_terms:
+                unfolded[rewritten_subscripts] += coeff * rewritten_coeff
+            unfolded_rest += coeff * rewritten_rest
+
+        terms = {s: coeff for s, coeff in unfolded.items() if coeff != 0}
+        rest = unfolded_rest
+
+def modular_inverse(number, modulus):
+    '''
+    Return the inverse of `number` modulo `modulus`, by the extended Euclid's algorithm.
+    '''
+    r, new_r, t, new_t = modulus, number % modulus, 0, 1
+    while new_r:
+        quotient = r // new_r
+        r, new_r, t, new_t = new_r, r - quotient * new_r, new_t, t - quotient * new_t
+    if r != 1: raise ValueError('{} is not invertible modulo {}.'.format(number, modulus))
+    return t % modulus
+
+def residue(number, modulus):
+    '''
+    Return the residue of an exact `number`, an `int` or a `Fraction`, modulo `modulus`.
+
+    Examples
+    ========
+
+    >>> residue(-7, 5), residue(Fraction(1, 2), 7), residue(Fraction(3, 4), 7)
+    (3, 4, 6)
+    >>> residue(Fraction(1, 2), 4)
+    Traceback (most recent call last):
+    ...
+    ValueError: 2 is not invertible modulo 4.
+    '''
+    if isinstance(number, Fraction): 
+        return number.numerator * modular_inverse(number.denominator, modulus) % modulus
+    return number % modulus
+
+def int64_fits(bound):
+    return bound <= 2**63 - 1
+
+def numpy_unfold_iter(rule, combination):
+    '''
+    Same as `numeric_unfold_iter` for `shift_invariant` rules of unary recurrences, where
+    each unfolding is a convolution of arrays. I use `int64` arrays while coefficients are
+    integers that surely fit, `object` arrays of exact numbers otherwise; unfoldings are
+    yielded as pairs `(start, coefficients)`, where `coefficients[i]` is the coefficient of
+    `f[start + i]`.
+    '''
+    import numpy as np
+
+    terms, _ = combination
+    kernel_offsets = [o for (o,), _ in rule.offsets]
+    kernel_start = min(kernel_offsets)
+    kernel = [0] * (max(kernel_offsets) - kernel_start + 1)
+    for (o,), coeff in rule.offsets: kernel[o - kernel_start] += exact_number(coeff)
+
+    start = min(s for s, in terms)
+    coefficients = [0] * (max(s for s, in terms) - start + 1)
+    for (s,), coeff in terms.items(): coefficients[s - start] = coeff
+
+    def as_array(values):
+        integral = all(isinstance(v, int) for v in values)
+        bound = max(abs(v) for v in values)
+        return np.array(values, dtype=np.int64 if integral and int64_fits(bound) else object)
+
+    kernel, coefficients = as_array(kernel), as_array(coefficients)
+    kernel_norm = sum(abs(v) for v in kernel.tolist())
+    while True:
+        yield start, coefficients
+
+        if coefficients.dtype == np.int64 and not int64_fits(int(np.abs(coefficients).max()) * kernel_norm):
+            coefficients = coefficients.astype(object)
+
+        convolving_kernel = kernel.astype(object) if coefficients.dtype == object else kernel
+        coefficients = np.convolve(coefficients, convolving_kernel)
+        start = start + kernel_start
+
@@ -0,0 +1,66 @@
+
+from sympy import S, Dummy, Poly, cancel
+
+def shifts_of(combination, index):
+    '''
+    Read a unary `linear_combination` as a shift operator, namely a dictionary that maps
+    each integer `k` to the coefficient of `f[n + k]`, where `n` is `index`; return `None`
+    if some subscript is not an integer shift of `index`.
+    '''
+    shifts = {}
+    for (subscript,), coeff in combination.items():
+        offset = subscript - index
+        if not offset.is_Integer: return None
+        shifts[int(offset)] = coeff
+    return shifts
+
+def constant_shifts_of(combination, index):
+    '''
+    Same as `shifts_of`, but `None` is returned also when coefficients or the rest of
+    `combination` depend on `index`.
+    '''
+    shifts = shifts_of(combination, index)
+    if shifts is None or combination.rest.has(index): return None
+    if any(coeff.has(index) for coeff in shifts.values()): return None
+    return shifts
+
+def shifts_as_poly(shifts, x):
+    '''
+    Return the pair `(least, poly)` such that `x**least * poly` is the Laurent polynomial
+    `sum(c * x**k for k, c in shifts.items())` and `poly` is an ordinary polynomial in `x`.
+    '''
+    least = min(shifts)
+    return least, Poly.from_dict({(k - least,): c for k, c in shifts.items()}, x)
+
+def poly_as_shifts(least, poly):
+    return {least + k: c for (k,), c in poly.terms() if c != 0}
+
+def power_of_shifts(shifts, exponent, multiplier=None):
+    '''
+    Return the shift operator `multiplier * shifts**exponent`, where `multiplier` defaults
+    to the identity; powers are computed by repeated squaring, so `exponent` is consumed
+    in a logarithmic number of polynomial multiplications.
+
+    Examples
+    ========
+
+    >>> from sympy import symbols
+    >>> a = symbols('a')
+    >>> sorted(power_of_shifts({-1: 1, -2: 1}, 4).items())
+    [(-8, 1), (-7, 4), (-6, 6), (-5, 4), (-4, 1)]
+    >>> sorted(power_of_shifts({-1: a}, 3, multiplier={0: 1, 2: 1}).items())
+    [(-3, a**3), (-1, a**3)]
+    '''
+    x = Dummy()
+    least, poly = shifts_as_poly(shifts, x)
+    least, poly = least * exponent, poly**exponent
+    if multiplier:
+        multiplier_least, multiplier_poly = shifts_as_poly(multiplier, x)
+        least, poly = least + multiplier_least, poly * multiplier_poly
+    return poly_as_shifts(least, poly)
+
+def geometric_sum(ratio, terms):
+    '''
+    Return `1 + ratio + ratio**2 + ... + ratio**(terms - 1)`.
+    '''
+    return S(terms) if ratio == 1 else cancel((ratio**terms - 1) / (ratio - 1))
@@ -0,0 +1,153 @@
+
+import functools
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+class phase_stats:
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+
+class null_phase:
+    '''
+    What `phase` returns while profiling is disabled: entering and leaving me does nothing.
+    '''
+    def __enter__(self): return self
+
+    def __exit__(self, *exc_info): return False
+
+no_phase = null_phase()
+
+class timed_phase:
+
+    def __init__(self, profile, name):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.record(self.name, self.started, time.perf_counter())
+        return False
+
+class profiler:
+    '''
+    Collector of the number of calls and the cumulative time of named phases, and of counters.
+
+    Time of a phase includes the time of phases nested in it, as for `cProfile`'s cumulative
+    column; moreover, if `trace` is true each call is kept as an event, to be exported in the
+    Chrome trace format (load it in `chrome://tracing` or Perfetto) by `chrome_trace`.
+    '''
+
+    def __init__(self, trace=False):
+        self.phases = OrderedDict()
+        self.counters = OrderedDict()
+        self.events = [] if trace else None
+        self.origin = time.perf_counter()
+
+    def phase(self, name): return timed_phase(self, name)
+
+    def record(self, name, started, finished):
+
+        stats = self.phases.get(name)
+        if stats is None: stats = self.phases[name] = phase_stats()
+        stats.calls += 1
+        stats.seconds += finished - started
+
+        if self.events is not None:
+            self.events.append(dict(name=name, ph='X', pid=os.getpid(), tid=threading.get_ident(),
+                                    ts=(started - self.origin) * 1e6, dur=(finished - started) * 1e6))
+
+    def count(self, name, increment=1):
+
+        self.counters[name] = self.counters.get(name, 0) + increment
+
+        if self.events is not None:
+            self.events.append(dict(name=name, ph='C', pid=os.getpid(), tid=threading.get_ident(),
+                                    ts=(time.perf_counter() - self.origin) * 1e6,
+                                    args={name: self.counters[name]}))
+
+    def report(self):
+        '''
+        Return a table of phases, from the most expensive one, followed by counters.
+        '''
+        lines = ['{:<32}{:>10}{:>14}{:>14}'.format('phase', 'calls', 'total (s)', 'mean (ms)')]
+        for name, stats in sorted(self.phases.items(), key=lambda item: -item[1].seconds):
+            lines.append('{:<32}{:>10}{:>14.6f}{:>14.6f}'.format(
+                name, stats.calls, stats.seconds, 1e3 * stats.seconds / stats.calls))
+        for name, value in self.counters.items():
+            lines.append('{:<32}{:>10}'.format(name, value))
+        return '\n'.join(lines)
+
+    def chrome_trace(self):
+        if self.events is None: raise ValueError('Profiling without `trace=True` keeps no events.')
+        return dict(traceEvents=self.events, displayTimeUnit='ms')
+
+    def dump_chrome_trace(self, path):
+        with open(path, 'w') as output: json.dump(self.chrome_trace(), output)
+
+# the profiler in charge, if any
+active_profiler = None
+
+def phase(name):
+    '''
+    Return a context manager that accounts the time spent within it to phase `name`, if
+    profiling is enabled; otherwise, `no_phase` is returned, which costs nothing.
+    '''
+    return no_phase if active_profiler is None else active_profiler.phase(name)
+
+def count(name, increment=1):
+    '''
+    Increment counter `name` by `increment`, if profiling is enabled.
+    '''
+    if active_profiler is not None: active_profiler.count(name, increment)
+
+def profiled(name):
+    '''
+    Decorate a function to account each of its calls to phase `name`.
+    '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwds):
+            with phase(name): return func(*args, **kwds)
+        return wrapper
+    return decorator
+
+@contextmanager
+def profiling(trace=False, profile=None):
+    '''
+    Enable profiling within my body, binding the `profiler` collecting phases and counters;
+    an existing `profile` can be given to accumulate across many bodies.
+
+    Examples
+    ========
+
+    >>> with profiling(trace=True) as profile:
+    ...     with phase('solve'): pass
+    ...     with phase('solve'): pass
+    ...     count('terms_cache hits', 3)
+    >>> profile.phases['solve'].calls, dict(profile.counters)
+    (2, {'terms_cache hits': 3})
+    >>> [event['ph'] for event in profile.chrome_trace()['traceEvents']]
+    ['X', 'X', 'C']
+    >>> phase('solve') is no_phase
+    True
+    >>> print(profile.report()) # doctest: +ELLIPSIS
+    phase                                calls     total (s)     mean (ms)
+    solve                                    2      ...
+    terms_cache hits                         3
+    '''
+    global active_profiler
+
+    previous, active_profiler = active_profiler, profile or profiler(trace)
+    try:
+        yield active_profiler
+    finally:
+        active_profiler = previous
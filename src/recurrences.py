@@ -1,63 +1,135 @@
 
 import copy
 from functools import reduce
-from string import Template
 
 from sympy import *
 from sympy.printing.latex import latex
 
+import collections
+import heapq
 import itertools 
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 from utils import *
 from instantiating import *
 from destructuring import *
 from equations import *
 from terms import *
+from caching import *
+from compiling import *
+from combinations import *
+from numerics import *
+from powering import *
+from storage import *
+from profiling import *
+from telemetry import *
+from typesetting import *
 
 
 class recurrence_spec: # {{{
 
-    def __init__(self, recurrence_eq, recurrence_symbol, variables, terms_cache={}):
-        self.recurrence_eq = recurrence_eq
+    # cached terms shown at the beginning, and as many at the end, of `Gamma` in notebooks
+    html_entries = 10
+
+    # true when my `terms_cache` misses rewritings performed to get my recurrence
+    lacks_rewritings = False
+
+    # LaTeX sources typeset by `_repr_html_`, created at its first call
+    latex_cache = None
+
+    def __init__(self, recurrence_eq, recurrence_symbol, variables, terms_cache=None):
         self.indexed = recurrence_symbol
         self.index = variables # rename to `indexes`
-        self.terms_cache = terms_cache
+        self.recurrence_eq = recurrence_eq
+        self.terms_cache = (terms_cache if isinstance(terms_cache, lru_terms_cache) 
+                                else lru_terms_cache(terms_cache or {}))
+        self.compiled = None
+        self.sorting_keys, self.evaluated_eq = {}, None
         
     # display and representation messages  {{{
     #________________________________________________________________________
 
-    def _repr_html_(self, include_terms_cache=True, doit=True):
+    def _repr_html_(self, include_terms_cache=True, doit=True, entries=None):
         '''
         Jupyter notebook integration for pretty printing
 
         Taken from: http://ipython.readthedocs.io/en/stable/config/integrating.html
-        '''
 
-        def subscripts_of(key):
-            with bind_Mul_indexed(key, self.indexed) as (_, subscripts):
-                return tuple(subscripts)
+        Only the first and the last `entries` cached terms are shown, `html_entries` by 
+        default, once for each subscripts where indexes are zero, followed by a line that
+        counts the cached terms not shown, out of the whole `terms_cache`; moreover, LaTeX
+        sources of terms and the evaluation of my recurrence are memoized across calls, in
+        my own `latex_cache` and `evaluated_eq`.
+
+        Examples
+        ========
+
+        >>> f, n = IndexedBase('f'), symbols('n')
+        >>> unfolded = recurrence_spec(Eq(f[n+2], f[n+1] + f[n]), f, [n]).unfold(depth=6)
+        >>> len(unfolded.terms_cache)
+        12
+        >>> unfolded._repr_html_(entries=2).split('</ul>')[1]
+        '8 of 12 cached terms are not shown.'
+        >>> unfolded._repr_html_(entries=6).split('</ul>')[1]
+        ''
+        '''
 
+        if entries is None: entries = self.html_entries
+        if self.latex_cache is None: self.latex_cache = make_latex_cache()
 
-        substitutions = dict(zip(self.index, itertools.repeat(0)))
-        keys_with_integral_subscripts = {k.subs(substitutions):k for k in self.terms_cache}
-        integral_subscrips = {subscripts_of(k):k for k in keys_with_integral_subscripts}
-        sorted_subscripts = sorted(integral_subscrips.keys())
-        ordered_terms_cache = [Eq(symbolic_key, self.terms_cache[symbolic_key]) 
-                                for k in sorted_subscripts
-                                for symbolic_key in [keys_with_integral_subscripts[integral_subscrips[k]]]]
+        recurrence_eq = self.recurrence_eq
+        if doit:
+            if self.evaluated_eq is None or self.evaluated_eq[0] is not recurrence_eq:
+                self.evaluated_eq = recurrence_eq, recurrence_eq.doit()
+            recurrence_eq = self.evaluated_eq[1]
 
+        Gamma, not_shown = '', 0
+        if include_terms_cache:
+            keys, elided = self.displayed_terms_cache_keys(entries)
+            not_shown = len(self.terms_cache) - len(keys)
+            rows = [cached_latex(Eq(k, self.terms_cache[k]), self.latex_cache) for k in keys]
+            if elided: rows.insert(entries, r'\vdots')
+            Gamma = r'<li>$\Gamma = \left\{{\begin{{array}}{{c}}{terms_cache}\end{{array}}\right\}}$</li>'.format(
+                terms_cache=r'\\'.join(rows))
 
         src = r'$\left(\Theta, \Gamma\right)_{{{index}}}^{{{sym}}}$ where: <br><ul>{Theta}{Gamma}</ul>'.format(
             sym=latex(self.indexed),
             index=','.join(map(latex, self.index)),
             #index=latex(self.index),
             Theta=r'<li>$\Theta = \left\{{ {rec_eqs} \right\}}$</li>'.format(
-                rec_eqs=latex(self.recurrence_eq.doit() if doit else self.recurrence_eq)),
-            Gamma=r'<li>$\Gamma = \left\{{\begin{{array}}{{c}}{terms_cache}\end{{array}}\right\}}$</li>'.format(
-                terms_cache=r'\\'.join(map(latex, ordered_terms_cache))))
+                rec_eqs=cached_latex(recurrence_eq, self.latex_cache)),
+            Gamma=Gamma)
+
+        if not_shown: 
+            src += '{} of {} cached terms are not shown.'.format(not_shown, len(self.terms_cache))
 
         return src
 
+    def displayed_terms_cache_keys(self, entries):
+        '''
+        Return the pair `(keys, omitted)`, where `keys` are the first and the last `entries` 
+        keys of `terms_cache`, ordered by their subscripts where indexes are zero, and 
+        `omitted` is the number of the others; keys with the same such subscripts are 
+        shown once. Subscripts of each key are computed at its first request only, and
+        `keys` are selected without sorting the whole `terms_cache`.
+        '''
+
+        substitutions = dict(zip(self.index, itertools.repeat(0)))
+        for k in self.terms_cache:
+            if k not in self.sorting_keys:
+                with bind_Mul_indexed(k.xreplace(substitutions), self.indexed) as (_, subscripts):
+                    self.sorting_keys[k] = tuple(subscripts)
+
+        keys_by_subscripts = {self.sorting_keys[k]: k for k in self.terms_cache}
+        if len(keys_by_subscripts) <= 2*entries: 
+            return [keys_by_subscripts[s] for s in sorted(keys_by_subscripts)], 0
+
+        first = heapq.nsmallest(entries, keys_by_subscripts)
+        last = heapq.nlargest(entries, keys_by_subscripts)[::-1]
+        return [keys_by_subscripts[s] for s in first + last], len(keys_by_subscripts) - 2*entries
+
     def description_markdown(self, **kwds):
 
         from IPython.display import Markdown
@@ -66,135 +138,264 @@ class recurrence_spec: # {{{
     #________________________________________________________________________}}}
 
 
-    def rewrite(self, according_to):
+    def metrics(self, depth=None):
+        '''
+        Return the `expression_metrics` of my rhs together with the size of `terms_cache`, as 
+        a record for `telemetry` consumers, where `depth` is the one of my unfolding.
+        '''
+        record = dict(depth=depth, terms_cache=len(self.terms_cache))
+        record.update(expression_metrics(self.recurrence_eq.rhs))
+        return record
 
+    def sparse(self):
+        '''
+        Return myself as a `sparse_recurrence_spec`, to unfold by dictionary operations.
+        '''
+        return sparse_recurrence_spec(recurrence_eq=self.recurrence_eq,
+                                      recurrence_symbol=self.indexed,
+                                      variables=self.index,
+                                      terms_cache=self.terms_cache.copy())
 
-        eq, index, indexed = according_to.recurrence_eq, according_to.index, according_to.indexed
-        unfolding_recurrence_eq, terms_cache = self.recurrence_eq, copy.copy(self.terms_cache)
+    def derived_spec(self, recurrence_eq, terms_cache):
+        '''
+        Return a spec of my same type, on my indexed term and indexes, with the given equation 
+        and cache, that lacks rewritings if I lack them.
+        '''
+        derived = type(self)(recurrence_eq=recurrence_eq,
+                             recurrence_symbol=self.indexed,
+                             variables=self.index,
+                             terms_cache=terms_cache)
+        derived.lacks_rewritings = self.lacks_rewritings
+        return derived
+
+    def ensure_rewritings(self, operation):
+        if self.lacks_rewritings:
+            raise ValueError('Cannot {} a spec unfolded by powering, since its `terms_cache` lacks '
+                             'rewritings; unfold with `powering=False` instead.'.format(operation))
+
+    def compile(self):
+        '''
+        Return my recurrence as a `compiled_recurrence`, building it at the first request only.
+        '''
+        if self.compiled is None: 
+            self.compiled = compiled_recurrence(self.recurrence_eq, self.indexed, self.index)
+        return self.compiled
+
+    def rewrite(self, according_to):
 
-        # the following normal form could be computed in the ctor?
-        with    bind_Mul_indexed(eq.lhs, indexed) as (coeff, subscripts), \
-                bind(dict(zip(index, subscripts)), single=True) as subscripts_rel, \
-                isolated_lhs_normal_form(eq, subscripts_rel) as eq_in_nf:
-                    normalized_eq = eq_in_nf
+        index, indexed, compiled = according_to.index, according_to.indexed, according_to.compile()
+        unfolding_recurrence_eq, terms_cache = self.recurrence_eq, self.terms_cache.copy()
 
         def unfolding(rhs_term):
             
-
             if symbol_of_Indexed(indexed) not in rhs_term.free_symbols: return rhs_term
-            elif rhs_term in terms_cache: return terms_cache[rhs_term]
 
-            with    bind_Mul_indexed(rhs_term, indexed) as (coeff, subscripts), \
-                    bind(dict(zip(index, subscripts)), single=True) as constraints, \
-                    instantiate_eq(normalized_eq, constraints) as instantiated_eq, \
-                    bind_Mul_indexed(instantiated_eq.lhs, indexed) as (coeff_lhs, _):
+            cached_term = terms_cache.lookup(rhs_term)
+            if cached_term is not None: return cached_term
+
+            with bind_Mul_indexed(rhs_term, indexed) as (coeff, subscripts):
 
-                    # if coeff == coeff_lhs then we've a perfect match for unfolding
-                    unfolded_term = instantiated_eq.rhs * (coeff/coeff_lhs)
+                unfolded_term = compiled.unfold(coeff, subscripts)
 
-                    # here we could perform a simplification using:
-                    #simplified_eq = Eq(rhs_term, unfolded_term).simplify() 
-                    #terms_cache[simplified_eq.lhs] = simplified_eq.rhs
-                    terms_cache[rhs_term] = unfolded_term
+                # here we could perform a simplification using:
+                #simplified_eq = Eq(rhs_term, unfolded_term).simplify() 
+                #terms_cache[simplified_eq.lhs] = simplified_eq.rhs
+                terms_cache[rhs_term] = unfolded_term
 
-                    return unfolded_term    
+                return unfolded_term    
             
+        # a single `Add` of the unfolded terms, not a fold of binary ones, so that its depth doesn't
+        # grow with the number of summands, as SymPy visits terms recursively
         rhs_terms = explode_term_respect_to(unfolding_recurrence_eq.rhs, cls=Add, deep=True)
-        with map_reduce(on=rhs_terms, doer=unfolding, 
-                        reducer=lambda reduced, term: not_evaluated_Add(reduced, term), 
-                        initializer=Integer(0)) as folded_rhs_term:
-            return recurrence_spec(recurrence_eq=Eq(unfolding_recurrence_eq.lhs, folded_rhs_term), 
-                                   recurrence_symbol=indexed, 
-                                   variables=index, 
-                                   terms_cache=terms_cache)
+        folded_rhs_term = not_evaluated_Add(*map(unfolding, rhs_terms))
+        rewritten = recurrence_spec(recurrence_eq=Eq(unfolding_recurrence_eq.lhs, folded_rhs_term), 
+                                    recurrence_symbol=indexed, 
+                                    variables=index, 
+                                    terms_cache=terms_cache)
+        rewritten.lacks_rewritings = self.lacks_rewritings
+        return rewritten
 
     def factor(self, *gens, **kwds):
 
         eq = self.recurrence_eq
         rhs = factor(eq.rhs, *gens, **kwds)
 
-        return recurrence_spec( recurrence_eq=Eq(eq.lhs, rhs),
-                                recurrence_symbol=self.indexed,
-                                variables=self.index,
-                                terms_cache=copy.copy(self.terms_cache))  
+        return self.derived_spec(Eq(eq.lhs, rhs), self.terms_cache.copy())
 
-    def subsume(self, additional_terms={}):
+    def subsume(self, additional_terms=None):
 
-        def worker(previous_terms_cache, do_one_more_step):
-        
-            if not do_one_more_step: return previous_terms_cache
-            else: do_one_more_step = False
-                
-            def subterm_mapping(subterm):    
-                    
-                nonlocal do_one_more_step
-                new_subterm = subterm
-                
-                if subterm.free_symbols:
-                    new_subterm = subterm.subs(previous_terms_cache)
-                    if subterm != new_subterm: do_one_more_step = True
-                    
-                return new_subterm
-                
-            with fmap_on_dict(  on=previous_terms_cache, 
-                                value_doer=subterm_mapping, 
-                                also_for_keys=False) as current_terms_cache:
-                return worker(current_terms_cache, do_one_more_step)
+        self.ensure_rewritings('subsume')
 
-        
-        additional_terms.update(self.terms_cache)
-        subsumed_terms_cache = worker(additional_terms, do_one_more_step=True)
+        terms = dict(additional_terms or {})
+        terms.update(self.terms_cache)
+        subsumed_terms_cache = subsume_terms(terms)
 
-        return recurrence_spec( recurrence_eq=self.recurrence_eq,
-                                recurrence_symbol=self.indexed,
-                                variables=self.index,
-                                terms_cache=subsumed_terms_cache)
+        return self.derived_spec(self.recurrence_eq, self.terms_cache.derive(subsumed_terms_cache))
         
     def subs(self, substitutions):
-        with fmap_on_dict(  on=self.terms_cache, 
-                            value_doer=lambda v: v.subs(substitutions, simultaneous=True)) as subs_terms_cache:
-            return recurrence_spec( recurrence_eq=self.recurrence_eq,
-                                    recurrence_symbol=self.indexed,
-                                    variables=self.index,
-                                    terms_cache=subs_terms_cache)
+        with phase('subs'):
+            with fmap_on_dict(  on=self.terms_cache, 
+                                value_doer=lambda v: v.subs(substitutions, simultaneous=True)) as subs_terms_cache:
+                return self.derived_spec(self.recurrence_eq, self.terms_cache.derive(subs_terms_cache))
 
-    def involute(self, depth=-1):
+    def involute(self, depth=-1, budget=None, max_size=None, return_passes=False):
+        '''
+        Substitute `terms_cache` into my recurrence repeatedly, at most `depth` times (no 
+        limit if negative), until the recurrence doesn't change anymore.
+
+        Each pass substitutes only cached terms whose indexed terms were introduced by the
+        previous pass, since the others have been already taken into account; moreover,
+        passes stop as soon as `budget` seconds elapsed or the recurrence has more than 
+        `max_size` nodes, if given. If `return_passes` is true, the pair of the involuted
+        spec and the number of performed passes is returned.
+        '''
 
-        if depth == 0: return self
-        
-        projection = recurrence_spec(recurrence_eq=self.recurrence_eq.subs(self.terms_cache, simultaneous=True),
-                                     recurrence_symbol=self.indexed,
-                                     variables=self.index,
-                                     terms_cache=self.terms_cache) 
-        
-        return projection.involute(depth=depth-1) if self.recurrence_eq != projection.recurrence_eq else projection
-            
+        self.ensure_rewritings('involute')
 
-    def matrix_vector_product(self, depth, arity, segment, based_instantiation=False):
+        keys_by_indexed = {}
+        for k in self.terms_cache:
+            for atom in k.atoms(Indexed): keys_by_indexed.setdefault(atom, []).append(k)
+
+        def substitutions_for(indexed_terms):
+            return {k: self.terms_cache[k] for atom in indexed_terms for k in keys_by_indexed.get(atom, [])}
+
+        started, passes = time.perf_counter(), 0
+        involuted_eq, substitutions = self.recurrence_eq, substitutions_for(self.recurrence_eq.atoms(Indexed))
+
+        while depth != passes and substitutions:
+
+            with phase('subs'): projected_eq = involuted_eq.subs(substitutions, simultaneous=True)
+            passes += 1
+            if projected_eq == involuted_eq: break
+
+            introduced = set().union(*(v.atoms(Indexed) for v in substitutions.values()))
+            involuted_eq, substitutions = projected_eq, substitutions_for(introduced & projected_eq.atoms(Indexed))
+
+            if budget is not None and time.perf_counter() - started > budget: break
+            if max_size is not None and sum(1 for _ in preorder_traversal(involuted_eq)) > max_size: break
+
+        projection = self.derived_spec(involuted_eq, self.terms_cache)
+
+        return (projection, passes) if return_passes else projection
+
+    def matrix_vector_product(self, depth, arity, segment, based_instantiation=False, 
+                              numeric=False, at=None, backend='python', sparse=False):
+
+        if numeric:
+            m, v, r = self.numeric_matrix_vector_product(depth, arity, segment, 
+                                                         based_instantiation, at, backend)
+            return m, v, r, None
 
         mapped_specs = self.map(arity=arity, depths=range(depth), based_instantiation=based_instantiation, 
                                 operator=lambda spec, depth: spec)
 
         first_term = self.indexed[segment[0]] if based_instantiation else self.recurrence_eq.lhs 
         eqs = [Eq(first_term, first_term, evaluate=False)] + [spec.recurrence_eq.doit() for spec in mapped_specs]
-        m, v, r = to_matrix_notation(eqs, self.indexed, segment)
+        m, v, r = to_matrix_notation(eqs, self.indexed, segment, sparse=sparse)
         return m, v, r, eqs
+
+    def numeric_matrix_vector_product(self, depth, arity, segment, based_instantiation=False, 
+                                      at=None, backend='python'):
+        '''
+        Same as `matrix_vector_product` but coefficients are computed on concrete subscripts 
+        with exact numbers, no unfolded term is ever built; only first order unfoldings of 
+        unary recurrences are supported.
+
+        When `based_instantiation` is false, indexes are instantiated by the dictionary `at`,
+        which is required. When `backend` is 'numpy', `m` is a NumPy array of `int64`s if 
+        every coefficient fits, of exact numbers otherwise.
+
+        Examples
+        ========
+
+        >>> c, n = IndexedBase('c'), Symbol('n')
+        >>> quicksort = recurrence_spec(Eq(c[n]/(n+1), 2/(n+1) + c[n-1]/n), c, [n])
+        >>> segment = [n - i for i in range(4)]
+        >>> m, v, r, _ = quicksort.matrix_vector_product(3, unary_indexed(), segment)
+        >>> nm, nv, nr = quicksort.numeric_matrix_vector_product(3, unary_indexed(), segment, at={n: 20})
+        >>> nm.row(0), (m.subs(n, 20), v.subs(n, 20), r.subs(n, 20)) == (nm, nv, nr)
+        (Matrix([[1/21, 0, 0, 0]]), True)
+        '''
+
+        if len(self.index) > 1: 
+            raise ValueError('Numeric unfoldings support unary recurrences only.')
+
+        index, = self.index
+        rule = numeric_rule(self.compile())
+        rhs_combination = linear_combination_of(self.recurrence_eq.rhs, self.indexed)
+
+        def unfoldings_at(substitutions):
+            combination = numeric_combination(rhs_combination, substitutions)
+            if backend == 'numpy' and rule.shift_invariant: 
+                return numpy_unfold_iter(rule, combination)
+            elif backend in ['numpy', 'python']: 
+                return (terms for terms, _ in numeric_unfold_iter(rule, combination))
+            raise ValueError('Unknown backend {}.'.format(backend))
+
+        def coefficient(row, column):
+            shift, unfolding = row
+            subscript = column - shift
+            if isinstance(unfolding, dict): return unfolding.get((subscript,), 0)
+            start, coefficients = unfolding
+            return coefficients[subscript - start] if 0 <= subscript - start < len(coefficients) else 0
+
+        if based_instantiation:
+
+            if not isinstance(arity, unary_indexed) or rule.offsets is None:
+                raise ValueError('Numeric based instantiation requires a unary recurrence '
+                                 'whose subscripts are shifts of the index.')
+
+            base, = arity.base_index
+            columns = [exact_number(o) for o in segment]
+            rows, lhs_vector = [(0, {(columns[0],): 1})], [self.indexed[segment[0]]]
+
+            # as `_instantiate_by_based` does, the index is chosen such that the smallest 
+            # subscript of each unfolding equals `base`; such subscript decreases by the
+            # smallest offset of the rule at each step.
+            least_offset = min(o for (o,), _ in rule.offsets)
+            least_subscript = min(exact_number(s - index) for (s,), _ in rhs_combination.items())
+            unfoldings = unfoldings_at({index: 0}) if rule.shift_invariant else None
+            for d in range(depth):
+                n_d = base - (least_subscript + d * least_offset)
+                if unfoldings: rows.append((n_d, next(unfoldings)))
+                else: rows.append((0, next(itertools.islice(unfoldings_at({index: n_d}), d, None))))
+                lhs_vector.append(self.recurrence_eq.lhs.xreplace({index: Integer(n_d)}))
+
+        else:
+
+            if at is None: raise ValueError('Numeric unfoldings require indexes instantiation `at`.')
+
+            columns = [exact_number(sympify(o).xreplace(at)) for o in segment]
+            lhs = self.recurrence_eq.lhs.xreplace(at)
+            with bind_Mul_indexed(lhs, self.indexed) as (coeff, subscripts):
+                rows, lhs_vector = [(0, {exact_subscripts(subscripts): exact_number(coeff)})], [lhs]
+            rows.extend((0, unfolding) for unfolding in itertools.islice(unfoldings_at(at), depth))
+            lhs_vector.extend([lhs] * depth)
+
+        if backend == 'numpy':
+            import numpy as np
+            m = np.array([[coefficient(row, column) for column in columns] for row in rows], dtype=object)
+            if all(isinstance(c, int) and int64_fits(abs(c)) for c in m.flat): m = m.astype(np.int64)
+        else:
+            m = Matrix(len(rows), len(columns), lambda r, c: sympify(coefficient(rows[r], columns[c])))
+
+        return m, Matrix([self.indexed[o] for o in columns]), Matrix(lhs_vector)
     
 
 
     def instantiate(self, strategy):
 
-        solutions = dispatch_message(variety=strategy, target=self).instantiate()
-        def subs_sols_into(term): 
-            return term.subs(solutions, simultaneous=True)
+        with phase('instantiate'):
 
-        with fmap_on_dict(  on=self.terms_cache, 
-                            key_doer=subs_sols_into, 
-                            also_for_values=True) as new_terms_cache:
+            solutions = dispatch_message(variety=strategy, target=self).instantiate()
+            def subs_sols_into(term): 
+                with phase('subs'): return term.subs(solutions, simultaneous=True)
 
-            return recurrence_spec(recurrence_eq=subs_sols_into(self.recurrence_eq),
-                        recurrence_symbol=self.indexed, 
-                        variables=self.index, terms_cache=new_terms_cache)
+            with fmap_on_dict(  on=self.terms_cache, 
+                                key_doer=subs_sols_into, 
+                                also_for_values=True) as new_terms_cache:
+
+                return self.derived_spec(subs_sols_into(self.recurrence_eq), self.terms_cache.derive(new_terms_cache))
 
     # dispatched messages  {{{
     #________________________________________________________________________
@@ -210,10 +411,11 @@ class recurrence_spec: # {{{
         for rhs_term in rhs_summands:
             try:
                 with bind_Mul_indexed(rhs_term, self.indexed) as (_, subscripts):
-                    eqs = {var: solve(Eq(base, rel), var).pop() 
-                           for var, base, rel in zip(self.index, 
-                                                     dispatcher.arity.base_index, 
-                                                     subscripts)} 
+                    with phase('solve'):
+                        eqs = {var: solve(Eq(base, rel), var).pop() 
+                               for var, base, rel in zip(self.index, 
+                                                         dispatcher.arity.base_index, 
+                                                         subscripts)} 
                     valid_equations.append(eqs)
             except DestructuringError: 
                 continue
@@ -244,34 +446,216 @@ class recurrence_spec: # {{{
     # higher order "operators" {{{
     #________________________________________________________________________
 
-    def unfold(self, depth=1, first_order=True):
-            
-        def first_order_reducer(folding_recurrence_spec, step): 
-            return folding_recurrence_spec.rewrite(according_to=self)
-        
-        def second_order_reducer(folding_recurrence_spec, step):
-            return folding_recurrence_spec.rewrite(according_to=folding_recurrence_spec)
+    def unfold(self, depth=1, first_order=True, numeric=False, at=None, store=None, telemetry=None, 
+               powering=False, backend='python'):
+        '''
+        Unfold myself `depth` times, according to myself if `first_order`, otherwise according
+        to the last unfolding; if `powering` is true, the first order unfolding is computed by
+        `unfold_by_powering`, whenever it applies. Numeric unfoldings are computed by `backend`,
+        as in `numeric_matrix_vector_product`.
+
+        If a callable is given as `telemetry`, it is called with the `metrics` of each unfolding
+        computed along the way, namely at each depth unless the unfolding is obtained directly,
+        by powering or numerically, where only the last one is recorded.
+        '''
 
-        unfolded_recurrence_spec = reduce(
-            first_order_reducer if first_order else second_order_reducer, 
-            range(depth), self)
-        
-        return unfolded_recurrence_spec
+        if store is not None:
+            key = fingerprint('unfold', self.recurrence_eq, self.indexed, self.index, 
+                              terms_digest(self.terms_cache), depth, first_order, numeric, at, powering, backend)
+            return store.fetch(key, lambda: self.unfold(depth, first_order, numeric, at, telemetry=telemetry, 
+                                                        powering=powering, backend=backend))
+
+        with phase('unfold'):
+
+            unfolded = None
+            if numeric: unfolded = self.numeric_unfold(depth, at, backend)
+            elif powering and first_order and depth > 0: unfolded = self.unfold_by_powering(depth)
+
+            if unfolded is not None:
+                if telemetry is not None: telemetry(unfolded.metrics(depth))
+                return unfolded
+
+            unfoldings = self.unfold_iter(first_order)
+            if telemetry is None: return next(itertools.islice(unfoldings, depth, None))
+
+            for current_depth, unfolded in zip(range(depth + 1), unfoldings):
+                telemetry(unfolded.metrics(current_depth))
+            return unfolded
+
+    def unfold_iter(self, first_order=True):
+        '''
+        Yield unfolded specs at depths `0, 1, 2, ...`, each one rewritten from the previous.
+
+        The spec at depth `d` is the same that `self.unfold(d, first_order)` returns, but 
+        consuming the first `d` unfoldings costs `d` rewrites instead of `d(d+1)/2`.
+        '''
+
+        unfolded_recurrence_spec = self
+        while True:
+            yield unfolded_recurrence_spec
+            according_to = self if first_order else unfolded_recurrence_spec
+            with phase('rewrite'): unfolded_recurrence_spec = unfolded_recurrence_spec.rewrite(according_to)
+
+    def unfold_by_powering(self, depth):
+        '''
+        Unfold myself `depth` times, first order, provided that I'm a unary recurrence whose
+        normal form has constant coefficients and integer shifts of the index as subscripts;
+        otherwise, return `None`.
+
+        Under such hypothesis, a rewriting step multiplies the rhs by the shift operator of
+        the normal form, hence the rhs at depth `d` is the rhs at depth `0` times the `d`-th 
+        power of such operator, which is computed by repeated squaring, exactly over integers 
+        or symbolically. 
+
+        Terms rewritten along the way are never built, so my `terms_cache` is kept as it is;
+        therefore, the returned spec has the same recurrence of `self.unfold(depth)` but not
+        its rewritings, hence it `lacks_rewritings` and both `subsume` and `involute` refuse it.
+
+        Since every term is rewritten at each step, the rhs at depth `d` has about `d` times
+        the order of summands, whose coefficients have `O(d)` digits: the result alone is 
+        quadratic in `d`, as is the last squaring, performed by SymPy on dense polynomials of
+        Python integers. Therefore powering saves the `d` rewrites of expression trees, but 
+        not the size of the result: depths of a few thousands take seconds, while depth 20000
+        takes more than minutes on Fibonacci, and depths as `10**6` are out of reach. The 
+        powers of the companion matrix don't help, since they give unfoldings where only the 
+        last rewritten terms are rewritten again, not first order ones.
+
+        Examples
+        ========
+
+        >>> f, n = IndexedBase('f'), Symbol('n')
+        >>> gapped = recurrence_spec(Eq(f[n], f[n-1] + f[n-3]), f, [n])
+        >>> gapped.unfold_by_powering(2).recurrence_eq.rhs
+        f[n - 3] + 3*f[n - 5] + 3*f[n - 7] + f[n - 9]
+        >>> gapped.unfold(2).recurrence_eq.rhs.doit() == _
+        True
+        >>> gapped.unfold(1).involute(depth=1).recurrence_eq.rhs.doit()
+        f[n - 2] + 2*f[n - 4] + f[n - 6]
+        >>> gapped.unfold(2, powering=True).terms_cache
+        lru_terms_cache({})
+        >>> gapped.unfold(2, powering=True).involute()
+        Traceback (most recent call last):
+        ...
+        ValueError: Cannot involute a spec unfolded by powering, since its `terms_cache` lacks rewritings; unfold with `powering=False` instead.
+
+        >>> weighted = recurrence_spec(Eq(f[n+2], 2*f[n+1] + 3*f[n] + 5), f, [n])
+        >>> weighted.unfold_by_powering(1).recurrence_eq.rhs
+        12*f[n - 1] + 9*f[n - 2] + 4*f[n] + 30
+        >>> weighted.unfold(1).recurrence_eq.rhs.doit() == _
+        True
+        >>> sorted(weighted.unfold(1).subsume().terms_cache.items(), key=str)
+        [(2*f[n + 1], 6*f[n - 1] + 4*f[n] + 10), (3*f[n], 6*f[n - 1] + 9*f[n - 2] + 15)]
+        '''
+
+        if len(self.index) > 1: return None
+
+        index, compiled = self.index[0], self.compile()
+        rule = compiled.unfold_combination(self.index)
+        rhs_combination = linear_combination_of(self.recurrence_eq.rhs, self.indexed)
+        shifts, rhs_shifts = constant_shifts_of(rule, index), shifts_of(rhs_combination, index)
+        if not shifts or not rhs_shifts: return None
+
+        unfolded = power_of_shifts(shifts, depth, multiplier=rhs_shifts)
+
+        # each rewritten term `c*f[s]` contributes `c*rest` to the rest, where `rest` is the 
+        # one of the normal form; moreover, coefficients sum up as powers of the operator do.
+        rest = rhs_combination.rest
+        if rule.rest != 0:
+            rest += rule.rest * Add(*rhs_shifts.values()) * geometric_sum(Add(*shifts.values()), depth)
+
+        summands = [coeff * self.indexed[index + offset] for offset, coeff in unfolded.items()]
+        unfolded_eq = Eq(self.recurrence_eq.lhs, Add(*(summands + [rest])), evaluate=False)
+        unfolded = self.derived_spec(unfolded_eq, self.terms_cache.copy())
+        unfolded.lacks_rewritings = True
+        return unfolded
+
+    def numeric_unfold(self, depth, at, backend='python'):
+        '''
+        Unfold myself `depth` times, first order, on indexes instantiated by `at`; coefficients
+        are computed with exact numbers and the result is a `sparse_recurrence_spec`.
+
+        When `backend` is 'numpy' and I'm a unary recurrence with a `shift_invariant` rule,
+        unfoldings are convolutions computed by `numpy_unfold_iter`; otherwise, and when
+        `backend` is 'python', they are computed by `numeric_unfold_iter`.
+
+        Examples
+        ========
+
+        >>> f, n = IndexedBase('f'), Symbol('n')
+        >>> weighted = recurrence_spec(Eq(f[n+2], 2*f[n+1] + 3*f[n] + 5), f, [n])
+        >>> weighted.numeric_unfold(3, {n: 10}).recurrence_eq
+        Eq(f[12], 81*f[4] + 216*f[5] + 216*f[6] + 96*f[7] + 16*f[8] + 780)
+        >>> weighted.numeric_unfold(3, {n: 10}, backend='numpy').recurrence_eq == _
+        True
+        '''
+
+        rule = numeric_rule(self.compile())
+        combination = numeric_combination(linear_combination_of(self.recurrence_eq.rhs, self.indexed), at)
+
+        if backend == 'numpy' and len(self.index) == 1 and rule.shift_invariant:
+            # each rewritten term `c*f[s]` contributes `c` times the rest of the rule
+            rest, rule_rest = combination[1], exact_number(rule.template.rest)
+            for current_depth, (start, coefficients) in zip(range(depth + 1), numpy_unfold_iter(rule, combination)):
+                if rule_rest and current_depth < depth: rest += rule_rest * sum(coefficients.tolist())
+            terms = {(start + i,): coeff for i, coeff in enumerate(coefficients.tolist()) if coeff != 0}
+        elif backend in ['numpy', 'python']:
+            terms, rest = next(itertools.islice(numeric_unfold_iter(rule, combination), depth, None))
+        else: 
+            raise ValueError('Unknown backend {}.'.format(backend))
+
+        unfolded = linear_combination(self.indexed, rest=sympify(rest))
+        for subscripts, coeff in terms.items(): unfolded.add_term(sympify(coeff), map(Integer, subscripts))
+
+        return sparse_recurrence_spec(recurrence_eq=self.recurrence_eq.lhs.xreplace(at),
+                                      recurrence_symbol=self.indexed, 
+                                      variables=self.index, 
+                                      combination=unfolded)
 
     def map(self, arity, depths, 
             operator=lambda *args: args,
             based_instantiation=True, 
             return_comprehensive_terms_cache=False,
+            executor=None, workers=None, store=None, telemetry=None,
             **kwds):
+        '''
+        Apply `operator` to each unfolding at `depths`, instantiated according to `arity` if
+        `based_instantiation` is true, together with its depth; results are yielded lazily.
+
+        If an `executor` (as a `concurrent.futures.ProcessPoolExecutor`) or a number of 
+        `workers` is given, distinct depths are sorted and split in as many contiguous ranges
+        as `workers` (the number of CPUs by default), each one unfolded incrementally and
+        instantiated by a process, while `operator` is applied here as results arrive, in the
+        order of `depths`; a pool built for `workers` is shut down when results are exhausted.
+        Since the range holding the deepest depth is unfolded from scratch anyway, the pool
+        pays off when instantiations dominate, not unfoldings.
+
+        If an `unfoldings_store` is given as `store`, instantiated unfoldings are fetched from
+        it, depth by depth, and only missing ones are computed and stored, serially, each one
+        resuming from the deepest unfolding computed so far; keys cover every option in `kwds`.
+
+        If a callable is given as `telemetry`, it is called with the `metrics` of each spec
+        before `operator` is applied to it.
+        '''
 
         # input destructuring to forward to composed functions
         first_order = kwds.get('first_order', True)
 
         comprehensive_terms_cache = {}
 
-        def worker(depth):
+        def apply_operator(processed_recurrence_spec, depth):
+            if telemetry is not None: telemetry(processed_recurrence_spec.metrics(depth))
+            return operator(processed_recurrence_spec, depth)
+
+        def unfoldings_at(depths):
+
+            # resume from the deepest unfolding reached so far, restarting only when going backwards
+            unfoldings, current_depth = self.unfold_iter(first_order), -1
+            for depth in depths:
+                if depth < current_depth: unfoldings, current_depth = self.unfold_iter(first_order), -1
+                while current_depth < depth: unfolded, current_depth = next(unfoldings), current_depth + 1
+                yield unfolded, depth
 
-            unfolded_evaluated_spec = self.unfold(depth, first_order)
+        def worker(unfolded_evaluated_spec, depth):
 
             comprehensive_terms_cache.update(unfolded_evaluated_spec.terms_cache)
 
@@ -279,9 +663,69 @@ class recurrence_spec: # {{{
             if based_instantiation: 
                 processed_recurrence_spec = processed_recurrence_spec.instantiate(strategy=based(arity))
 
-            return operator(processed_recurrence_spec, depth)
+            return apply_operator(processed_recurrence_spec, depth)
+
+        def pooled(depths):
 
-        mapped = map(worker, depths)
+            depths = list(depths)
+            ordered = sorted(set(depths))
+            size = max(1, -(-len(ordered) // (workers or os.cpu_count() or 1)))
+            ranges = [ordered[i:i+size] for i in range(0, len(ordered), size)]
+
+            pool = executor or ProcessPoolExecutor(max_workers=workers)
+            try:
+                pending = iter([(ranged, pool.submit(unfold_and_instantiate, self, ranged, first_order,
+                                                     arity if based_instantiation else None, 
+                                                     return_comprehensive_terms_cache))
+                                for ranged in ranges])
+
+                # results of ranges are kept until their depths are requested, the last time
+                ready, remaining = {}, collections.Counter(depths)
+                for depth in depths:
+                    while depth not in ready:
+                        ranged, future = next(pending)
+                        ready.update(zip(ranged, future.result()))
+
+                    terms_cache, processed_recurrence_spec = ready[depth]
+                    remaining[depth] -= 1
+                    if not remaining[depth]: del ready[depth]
+
+                    comprehensive_terms_cache.update(terms_cache)
+                    yield apply_operator(processed_recurrence_spec, depth)
+            finally:
+                if executor is None: pool.shutdown()
+
+        def stored(depths):
+
+            # every option that affects stored results is keyed, `operator` is applied afterwards
+            terms = terms_digest(self.terms_cache)
+            options = dict(kwds, based_instantiation=based_instantiation, 
+                           arity=arity if based_instantiation else None)
+
+            # missing depths are unfolded by resuming from the deepest one computed so far
+            unfoldings, current_depth = self.unfold_iter(first_order), -1
+            for depth in depths:
+
+                key = fingerprint('map', self.recurrence_eq, self.indexed, self.index, terms, depth, options)
+                entry = store.get(key)
+                if entry is None:
+                    if depth < current_depth: unfoldings, current_depth = self.unfold_iter(first_order), -1
+                    while current_depth < depth: unfolded, current_depth = next(unfoldings), current_depth + 1
+
+                    processed_recurrence_spec = unfolded
+                    if based_instantiation: 
+                        processed_recurrence_spec = processed_recurrence_spec.instantiate(strategy=based(arity))
+
+                    entry = dict(unfolded.terms_cache), processed_recurrence_spec
+                    store.put(key, entry)
+
+                terms_cache, processed_recurrence_spec = entry
+                comprehensive_terms_cache.update(terms_cache)
+                yield apply_operator(processed_recurrence_spec, depth)
+
+        if store is not None: mapped = stored(depths)
+        elif executor is None and workers is None: mapped = itertools.starmap(worker, unfoldings_at(depths))
+        else: mapped = pooled(depths)
 
         return (mapped, comprehensive_terms_cache) if return_comprehensive_terms_cache else mapped 
 
@@ -289,39 +733,141 @@ class recurrence_spec: # {{{
 
 # end of class `recurrence_spec` }}}
 
+def unfold_and_instantiate(rec_spec, depths, first_order, arity=None, return_terms_cache=False):
+    '''
+    Unfold `rec_spec` at each one of `depths`, sorted increasingly, and instantiate them by
+    the based strategy on `arity`, if given; unfoldings are computed incrementally, one step
+    after the other, from depth zero to the last one of `depths`.
+
+    I'm the unit of work that `recurrence_spec.map` sends to worker processes, hence I live
+    at module level to be pickled by reference; I return a list of pairs `(terms_cache, spec)`,
+    one for each depth, where `terms_cache` is the one of the unfolded spec, empty if not 
+    `return_terms_cache`.
+    '''
+
+    results, unfoldings, current_depth = [], enumerate(rec_spec.unfold_iter(first_order)), -1
+    for depth in depths:
 
-def ipython_latex_description(rec_spec, *args, **kwds):
-    
-    from IPython.display import Latex
+        while current_depth < depth: current_depth, unfolded_recurrence_spec = next(unfoldings)
+
+        processed_recurrence_spec = unfolded_recurrence_spec
+        if arity is not None: 
+            processed_recurrence_spec = processed_recurrence_spec.instantiate(strategy=based(arity))
+
+        terms_cache = dict(unfolded_recurrence_spec.terms_cache) if return_terms_cache else {}
+        results.append((terms_cache, processed_recurrence_spec))
+
+    return results
+
+class sparse_recurrence_spec(recurrence_spec): # {{{
+    '''
+    A `recurrence_spec` whose rhs is kept as a `linear_combination` of indexed terms.
+
+    Rewriting steps update a dictionary from subscripts to coefficients instead of nesting
+    unevaluated `Add` trees, and `recurrence_eq` is built only when requested. In `terms_cache`
+    each key is a *plain* indexed term `f[s]`, mapped to its rewriting.
+    When `combination` is given, `recurrence_eq` is the lhs term only.
+    '''
+
+    def __init__(self, recurrence_eq, recurrence_symbol, variables, terms_cache=None, combination=None):
+        self.combination = combination
+        recurrence_spec.__init__(self, recurrence_eq, recurrence_symbol, variables, terms_cache)
+
+    @property
+    def recurrence_eq(self):
+        if self.folded_eq is None: self.folded_eq = Eq(self.lhs, self.combination.as_expr())
+        return self.folded_eq
+
+    @recurrence_eq.setter
+    def recurrence_eq(self, eq):
+        if self.combination is None:
+            self.lhs, self.folded_eq = eq.lhs, eq
+            self.combination = linear_combination_of(eq.rhs, self.indexed)
+        else:
+            self.lhs, self.folded_eq = eq, None
+
+    def rewrite(self, according_to):
+
+        index, indexed, compiled = according_to.index, according_to.indexed, according_to.compile()
+        terms_cache = self.terms_cache.copy()
+
+        unfolded = linear_combination(indexed, rest=self.combination.rest)
+        for subscripts, coeff in self.combination.items():
+
+            cached_term = terms_cache.lookup(indexed[subscripts])
+            if cached_term is None:
+                unfolded_combination = compiled.unfold_combination(subscripts)
+                terms_cache[indexed[subscripts]] = unfolded_combination.as_expr()
+            else:
+                unfolded_combination = linear_combination_of(cached_term, indexed)
+
+            unfolded.accumulate(unfolded_combination, scale=coeff)
+
+        rewritten = sparse_recurrence_spec(recurrence_eq=self.lhs, 
+                                           recurrence_symbol=indexed, 
+                                           variables=index, 
+                                           terms_cache=terms_cache,
+                                           combination=unfolded)
+        rewritten.lacks_rewritings = self.lacks_rewritings
+        return rewritten
+
+    def factor(self, *gens, **kwds):
+        '''
+        Factor each coefficient of my combination, and its rest, so that I stay sparse; 
+        hence factors common to many coefficients are not collected, as `recurrence_spec` does.
+
+        Examples
+        ========
+
+        >>> f, n = IndexedBase('f'), symbols('n')
+        >>> spec = recurrence_spec(Eq(f[n+2], (n**2 - 1)*f[n+1] + (2*n + 2)*f[n]), f, [n]).sparse()
+        >>> factored = spec.factor()
+        >>> type(factored).__name__, sorted(factored.combination.items(), key=str)
+        ('sparse_recurrence_spec', [((n + 1,), (n - 1)*(n + 1)), ((n,), 2*(n + 1))])
+        '''
 
-    kwds['operator'] = lambda rec_spec, depth: latex(rec_spec.recurrence_eq) + r"\\"
+        factored = linear_combination(self.indexed, rest=factor(self.combination.rest, *gens, **kwds))
+        for subscripts, coeff in self.combination.items(): 
+            factored.add_term(factor(coeff, *gens, **kwds), subscripts)
+
+        spec = sparse_recurrence_spec(recurrence_eq=self.lhs, 
+                                      recurrence_symbol=self.indexed, 
+                                      variables=self.index, 
+                                      terms_cache=self.terms_cache.copy(),
+                                      combination=factored)
+        spec.lacks_rewritings = self.lacks_rewritings
+        return spec
+
+# end of class `sparse_recurrence_spec` }}}
+
+
+def ipython_latex_description(rec_spec, *args, stream=None, **kwds):
+    '''
+    Typeset the unfoldings that `rec_spec.map(*args, **kwds)` yields as a one column array.
+
+    If a file-like object is given as `stream`, each unfolding is written in it as soon as
+    it's computed, and nothing is returned; otherwise, a `Latex` object is returned.
+    '''
+
+    kwds['operator'] = lambda rec_spec, depth: rec_spec.recurrence_eq
 
     mapped = rec_spec.map(*args, **kwds)
-    template = Template(r"""\begin{array}{c}$content\end{array}""")
-    latex_src = template.substitute(content="\n".join(mapped))
+    if stream is not None: return write_latex_array(stream, mapped)
 
-    return Latex(latex_src)
+    from IPython.display import Latex
+    return Latex(latex_to_string(write_latex_array, mapped))
 
 # To be refactored {{{
 #________________________________________________________________________
 
 def take_apart_matched(term, indexed):
     
-    wild_coeff = Wild('coeff', exclude=[indexed])
-    wild_term, wild_subscript = Wild('term'), Wild('subscript')
+    try:
+        coeff, subscripts = destructure_Mul_indexed(term, indexed)
+    except DestructuringError:
+        return None
 
-    matched_term = term.match(wild_coeff * wild_term)
-
-    result = None
-
-    if matched_term: 
-        coeff, indexed_term = matched_term[wild_coeff], matched_term[wild_term]
-        matched_term_subscript = indexed_term.match(indexed[wild_subscript])
-        if matched_term_subscript:
-            term_subscript = matched_term_subscript[wild_subscript]
-            result = {'coeff':coeff, 'subscript':term_subscript}
-
-    return result
+    return {'coeff':coeff, 'subscript':subscripts[0]} if len(subscripts) == 1 else None
 
 def project_recurrence_spec(recurrence_spec, **props):
     
@@ -333,7 +879,7 @@ def project_recurrence_spec(recurrence_spec, **props):
 
 
 def take_sol(*args, sol_index=0):
-    sols = solve(*args)
+    with phase('solve'): sols = solve(*args)
     return sols[sol_index]
 
 def subsume_cache(recurrence_spec):
@@ -364,41 +910,37 @@ def subsume_cache(recurrence_spec):
 
     return subsumed_rec_specs.values()
 
-def to_matrix_notation(eqs, indexed, order):
-
-    lhs_vector = []
-    comb_dicts = [] 
-    
-    def worker(eq):
+def to_matrix_notation(eqs, indexed, order, sparse=False, include_lhs=True):
+    '''
+    Return the triple `(m, v, r)` such that `m * v = r` encodes `eqs` respect to terms 
+    `indexed[o]`, for `o` in `order`; summands indexed by a subscript not in `order` are
+    dropped, as the non-indexed ones are.
 
-        lhs_vector.append(eq.lhs)
+    Summands are visited once each and only non-zero entries are stored, so `m` is a 
+    `SparseMatrix` if `sparse` is true, a dense `Matrix` otherwise; `r` is `None` if 
+    `include_lhs` is false.
+    '''
 
-        comb_dict = {}
-        if isinstance(eq.rhs, Add):
-            for summand in flatten(eq.rhs.args, cls=Add):
-                matched = take_apart_matched(summand, indexed)
-                if matched: comb_dict.update( { matched['subscript']: matched['coeff'] } )
-                #else: print(summand)
-        else:
-            matched = take_apart_matched(eq.rhs, indexed)
-            if matched: comb_dict.update( { matched['subscript']: matched['coeff'] } )
+    eqs = list(eqs)
+    columns = {o: c for c, o in enumerate(order)}
+    entries = {}
 
-        comb_dicts.append(comb_dict)
+    for r, eq in enumerate(eqs):
+        with bind_Add_indexed(eq.rhs, indexed) as (destructured, _):
+            for coeff, subscripts in destructured:
+                c = columns.get(subscripts[0] if len(subscripts) == 1 else tuple(subscripts))
+                if c is not None: entries[r, c] = entries.get((r, c), S.Zero) + coeff
 
-    for eq in eqs: worker(eq)
+    rows, cols = len(eqs), len(columns)
+    comb_matrix = SparseMatrix(rows, cols, entries) if sparse else zeros(rows, cols)
+    if not sparse:
+        for (r, c), coeff in entries.items(): comb_matrix[r, c] = coeff
 
-    rows = len(comb_dicts)
     comb_vector = Matrix([indexed[o] for o in order])
-    cols = len(comb_vector[:,0])
-    comb_matrix = zeros(rows, cols)
-    
-    for r in range(rows):
-        for c in range(cols):
-            comb_dict, k = comb_dicts[r], order[c]
-            if k in comb_dict: comb_matrix[r, c] = comb_dict[k]
+    lhs_vector = Matrix([eq.lhs for eq in eqs]) if include_lhs else None
 
     #return Eq(Mul(comb_matrix, comb_vector, evaluate=False), Matrix(lhs_vector), evaluate=False)
-    return comb_matrix, comb_vector, Matrix(lhs_vector)
+    return comb_matrix, comb_vector, lhs_vector
 
 
 def fix_combination(eqs, adjust, fix):
@@ -0,0 +1,79 @@
+
+import importlib
+import sys
+import types
+
+__all__ = [ 'recurrence_spec', 'sparse_recurrence_spec', 'to_matrix_notation', 'ipython_latex_description',
+            'raw', 'based', 'unary_indexed', 'doubly_indexed',
+            'lru_terms_cache', 'unfoldings_store', 'fingerprint',
+            'compiled_recurrence', 'linear_combination', 'linear_combination_of',
+            'DestructuringError', 'DependencyCycleError',
+            'profiling', 'profiler', 'expression_metrics',
+            'riordan_array', 'riordan_rows', 'kernels_from_recs', 'kernels_from_gfs', 'congruence_colours',
+            'random_mismatch', 'start_notebook', ]
+
+# where each public name is defined; modules are imported as soon as one of their names is requested
+public_api = {  'recurrence_spec': 'recurrences',
+                'sparse_recurrence_spec': 'recurrences',
+                'to_matrix_notation': 'recurrences',
+                'ipython_latex_description': 'recurrences',
+                'raw': 'instantiating',
+                'based': 'instantiating',
+                'unary_indexed': 'instantiating',
+                'doubly_indexed': 'instantiating',
+                'lru_terms_cache': 'caching',
+                'unfoldings_store': 'storage',
+                'fingerprint': 'storage',
+                'compiled_recurrence': 'compiling',
+                'linear_combination': 'combinations',
+                'linear_combination_of': 'combinations',
+                'DestructuringError': 'destructuring',
+                'DependencyCycleError': 'utils',
+                'profiling': 'profiling',
+                'profiler': 'profiling',
+                'expression_metrics': 'telemetry',
+                'riordan_array': 'triangles',
+                'riordan_rows': 'triangles',
+                'kernels_from_recs': 'triangles',
+                'kernels_from_gfs': 'triangles',
+                'congruence_colours': 'triangles',
+                'random_mismatch': 'verifying', }
+
+class lazy_session(types.ModuleType):
+    '''
+    Module type of this session, which imports the module defining a public name at its first request.
+
+    Examples
+    ========
+
+    >>> import session
+    >>> session.recurrence_spec.__name__, session.unary_indexed.__module__
+    ('recurrence_spec', 'instantiating')
+    >>> session.explode_term_respect_to
+    Traceback (most recent call last):
+    ...
+    AttributeError: explode_term_respect_to is not part of the public API of session.
+    '''
+
+    def __getattr__(self, name):
+
+        if name not in public_api:
+            raise AttributeError('{} is not part of the public API of {}.'.format(name, self.__name__))
+
+        value = getattr(importlib.import_module(public_api[name]), name)
+        setattr(self, name, value)
+        return value
+
+def start_notebook(use_latex='mathjax', recursion_limit=100000):
+    '''
+    Prepare an interactive session as `start_session.py` did: clear SymPy's cache, set up
+    pretty printing and raise the recursion limit; batch jobs should not call me at all.
+    '''
+    from sympy import init_printing
+    from sympy.core.cache import clear_cache
+
+    clear_cache()
+    init_printing(use_latex=use_latex) # for nice printing, a-la' TeX
+    sys.setrecursionlimit(recursion_limit)
+
+sys.modules[__name__].__class__ = lazy_session
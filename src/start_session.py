@@ -5,9 +5,8 @@ import sympy
 from sympy import *
 from sympy.abc import x, n, z, t, k
 from sympy.core.cache import *
-    
-clear_cache()    
-        
-init_printing(use_latex='mathjax') # for nice printing, a-la' TeX
 
-sys.setrecursionlimit(100000)
+# interactive sessions only; batch jobs should `import session` instead, which loads lazily
+from session import start_notebook
+
+start_notebook(use_latex='mathjax') 
@@ -0,0 +1,96 @@
+
+from sympy import Add, Dummy, Eq, Indexed, solve
+
+from destructuring import *
+from terms import explode_term_respect_to
+
+class stencil:
+    '''
+    A recurrence on matrix coefficients compiled into a list of `(row_offset, col_offset, coeff)`
+    entries, relative to the coefficient being defined.
+
+    Coefficients `coeff` are expressions in symbols `row` and `col`, which stand for the
+    row and the column of the coefficient being defined; therefore, applying me to a cell
+    requires neither `solve` nor pattern matching, just integer arithmetic on offsets and,
+    for coefficients depending on indexes only, a replacement of `row` and `col`.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> m, n, k = IndexedBase('m'), *symbols('n k')
+    >>> A = compile_stencil(Eq(m[n+1, k+1], m[n, k] + (k+1)*m[n, k+1]), m, n, k)
+    >>> sorted((r, c) for r, c, _ in A.entries)
+    [(-1, -1), (-1, 0)]
+    >>> A.apply(Matrix([[1, 0], [1, 1]]), 2, 1) # 1*1 + (0 + 1)*1
+    2
+    >>> compile_stencil(Eq(m[2*n, k+1], m[n, k]), m, n, k) is None
+    True
+    '''
+
+    def __init__(self, entries, row, col):
+        self.entries = entries
+        self.row = row
+        self.col = col
+        self.varying = [coeff.has(row, col) for _, _, coeff in entries]
+
+    def apply(self, matrix, r, c):
+        '''
+        Return the combination of coefficients of `matrix` that defines the one at `(r, c)`,
+        where coefficients out of `matrix` are assumed to be zero.
+        '''
+        indexes = {self.row: r, self.col: c}
+
+        term = 0
+        for (row_offset, col_offset, coeff), varying in zip(self.entries, self.varying):
+            i, j = r + row_offset, c + col_offset
+            if 0 <= i < matrix.rows and 0 <= j < matrix.cols:
+                if varying: coeff = coeff.xreplace(indexes)
+                term = term + coeff * matrix[i, j]
+
+        return term
+
+def compile_stencil(rec, indexed_sym, row_sym, col_sym, first_column=False):
+    '''
+    Compile `rec`, an `Eq` object defining `indexed_sym[row, col]` in terms of coefficients
+    `indexed_sym[row + i, col + j]`, into a `stencil`; if `first_column` is true then `rec`
+    is a Z-recurrence, whose lhs lies in column `0`, as `Zsequence` expects.
+
+    Summands of the rhs that don't mention `indexed_sym` are dropped, as `unfold_in_matrix`
+    does; if some other summand isn't a product of a coefficient and a single term
+    `indexed_sym[row + i, col + j]`, for integers `i` and `j`, then I return `None`.
+    '''
+
+    lhs = rec.lhs
+    if not isinstance(lhs, Indexed) or lhs.base != indexed_sym or len(lhs.indices) != 2: return None
+
+    row_sym_index, col_sym_index = lhs.indices
+    row, col = Dummy('row'), Dummy('col')
+
+    sols = {row_sym: solve(Eq(row_sym_index, row), row_sym)[0]}
+    if first_column:
+        if col_sym_index != 0: return None
+        # Z-recurrences are instantiated at column `0` only, where offsets are absolute columns
+        sols_col = 0
+    else:
+        sols[col_sym] = solve(Eq(col_sym_index, col), col_sym)[0]
+        sols_col = col
+
+    entries = []
+    rhs = rec.rhs.subs(sols, simultaneous=True)
+    for summand in explode_term_respect_to(rhs, Add):
+
+        if not summand.has(indexed_sym): continue
+
+        try:
+            coeff, subscripts = destructure_Mul_indexed(summand, indexed_sym)
+        except DestructuringError:
+            return None
+
+        if len(subscripts) != 2: return None
+        row_offset, col_offset = subscripts[0] - row, subscripts[1] - sols_col
+        if not (row_offset.is_Integer and col_offset.is_Integer): return None
+
+        entries.append((int(row_offset), int(col_offset), coeff))
+
+    return stencil(entries, row, col)
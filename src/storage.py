@@ -0,0 +1,166 @@
+
+import hashlib
+import pickle
+import sqlite3
+import time
+
+import sympy
+from sympy import Basic, Dummy, Symbol, srepr, preorder_traversal
+
+# bump the first component whenever pickled objects change their shape
+STORE_VERSION = '2/sympy-{}'.format(sympy.__version__)
+
+def canonical_repr(obj):
+    '''
+    Return a string that identifies `obj` across sessions.
+
+    SymPy terms are represented by `srepr`, where `Dummy` symbols are renamed according
+    to the order of their first occurrence (their indexes depend on the session); lists,
+    tuples, sets and dictionaries are represented item by item and other objects by their
+    class name and attributes, so strategies and visitors are identified by their state.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> f, n = IndexedBase('f'), symbols('n')
+    >>> canonical_repr(Eq(f[n], Dummy('d')*f[n-1])) == canonical_repr(Eq(f[n], Dummy('d')*f[n-1]))
+    True
+    >>> canonical_repr([1, 'a', {n: 2}])
+    "[1, 'a', {Symbol('n'): 2}]"
+    '''
+
+    if isinstance(obj, Basic):
+        dummies = []
+        for subterm in preorder_traversal(obj):
+            if isinstance(subterm, Dummy) and subterm not in dummies: dummies.append(subterm)
+        renaming = {d: Symbol('_dummy_{}'.format(i), **d.assumptions0) for i, d in enumerate(dummies)}
+        return srepr(obj.xreplace(renaming))
+    elif isinstance(obj, (list, tuple)):
+        items = ', '.join(map(canonical_repr, obj))
+        return '[{}]'.format(items) if isinstance(obj, list) else '({})'.format(items)
+    elif isinstance(obj, (set, frozenset)):
+        return '{{{}}}'.format(', '.join(sorted(map(canonical_repr, obj))))
+    elif isinstance(obj, dict):
+        items = sorted('{}: {}'.format(canonical_repr(k), canonical_repr(v)) for k, v in obj.items())
+        return '{{{}}}'.format(', '.join(items))
+    elif hasattr(obj, '__dict__'):
+        return '{}({})'.format(type(obj).__name__, canonical_repr(vars(obj))[1:-1])
+
+    return repr(obj)
+
+def fingerprint(*parts):
+    '''
+    Hash the canonical representations of `parts`, to be used as key in an `unfoldings_store`.
+    '''
+    return hashlib.sha256(canonical_repr(parts).encode('utf-8')).hexdigest()
+
+def terms_digest(terms):
+    '''
+    Hash the items of `terms`, a mapping as a `terms_cache`, regardless of their order, so
+    that results depending on cached rewritings are keyed by them too.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> f, n = IndexedBase('f'), symbols('n')
+    >>> terms = {f[n+1]: f[n] + f[n-1], f[n]: f[n-1] + f[n-2]}
+    >>> terms_digest(terms) == terms_digest(dict(reversed(list(terms.items()))))
+    True
+    >>> terms_digest(terms) == terms_digest({f[n+1]: f[n] + f[n-1]})
+    False
+    '''
+    return fingerprint(dict(terms))
+
+class unfoldings_store:
+    '''
+    Persistent mapping from fingerprints to pickled results, backed by a SQLite database.
+
+    Entries written with a `version` different from mine are deleted when I'm opened, so a
+    new version of this package, or of SymPy, invalidates stale results. If `maxbytes` is
+    given, the least recently used entries are evicted as soon as pickled results exceed it.
+
+    Results are unpickled when fetched and unpickling can run arbitrary code, so open only
+    databases that you trust, namely written by yourself or by people you trust.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> f, n = IndexedBase('f'), symbols('n')
+    >>> store = unfoldings_store(':memory:')
+    >>> key = fingerprint('unfold', Eq(f[n], f[n-1] + f[n-2]), 3)
+    >>> store.fetch(key, lambda: 3*f[n-4])
+    3*f[n - 4]
+    >>> key in store, store.fetch(key, lambda: 1/0)
+    (True, 3*f[n - 4])
+    >>> small = unfoldings_store(':memory:', maxbytes=200)
+    >>> small.put('first', list(range(50)))
+    >>> small.put('second', list(range(50, 100)))
+    >>> 'first' in small, 'second' in small
+    (False, True)
+    '''
+
+    def __init__(self, path, maxbytes=None, version=STORE_VERSION):
+        self.path = path
+        self.maxbytes = maxbytes
+        self.version = version
+        self.connection = sqlite3.connect(path)
+
+        with self.connection:
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS entries (
+                                        key TEXT PRIMARY KEY, version TEXT, blob BLOB,
+                                        size INTEGER, accessed REAL)''')
+            self.connection.execute('DELETE FROM entries WHERE version != ?', (version,))
+
+    def __contains__(self, key):
+        cursor = self.connection.execute('SELECT 1 FROM entries WHERE key = ?', (key,))
+        return cursor.fetchone() is not None
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def get(self, key, default=None):
+        row = self.connection.execute('SELECT blob FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None: return default
+
+        with self.connection:
+            self.connection.execute('UPDATE entries SET accessed = ? WHERE key = ?', (time.time(), key))
+        return pickle.loads(row[0])
+
+    def put(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                                    (key, self.version, blob, len(blob), time.time()))
+        self.evict()
+
+    def fetch(self, key, compute):
+        '''
+        Return the entry for `key` if stored, otherwise store and return `compute()`.
+        '''
+        missing = object()
+        value = self.get(key, default=missing)
+        if value is missing:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def evict(self):
+
+        if self.maxbytes is None: return
+
+        size, = self.connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()
+        rows = self.connection.execute('SELECT key, size FROM entries ORDER BY accessed').fetchall()
+        with self.connection:
+            for key, entry_size in rows:
+                if size <= self.maxbytes: break
+                self.connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+                size -= entry_size
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute('DELETE FROM entries')
+
+    def close(self): self.connection.close()
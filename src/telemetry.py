@@ -0,0 +1,57 @@
+
+from sympy import Rational, count_ops, sympify
+
+def tree_depth(term):
+    '''
+    Return the height of the tree of `term`, where atoms have height 1.
+    '''
+    height, frontier = 0, [(term, 1)]
+    while frontier:
+        subterm, level = frontier.pop()
+        height = max(height, level)
+        frontier.extend((arg, level + 1) for arg in subterm.args)
+    return height
+
+def summands_count(term):
+    '''
+    Return the number of summands of `term`, looking through nested, not evaluated, `Add`s.
+    '''
+    summands, frontier = 0, [term]
+    while frontier:
+        subterm = frontier.pop()
+        if subterm.is_Add: frontier.extend(subterm.args)
+        else: summands += 1
+    return summands
+
+def coefficient_bits(term):
+    '''
+    Return the bit length of the biggest numerator or denominator of rationals in `term`.
+    '''
+    return max([0] + [max(abs(r.p).bit_length(), r.q.bit_length()) for r in term.atoms(Rational)])
+
+def expression_metrics(*terms):
+    '''
+    Measure the complexity of `terms`, as a whole: the number of summands and operations
+    are summed, while tree depth and coefficients bit length are the greatest ones.
+
+    Such metrics are the ones that grow along unfoldings, eventually exhausting memory;
+    recording them per depth, through the `telemetry` argument of `recurrence_spec.unfold`,
+    `recurrence_spec.map` or `unfold_in_matrix`, shows a super-linear growth in advance.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> f, n = IndexedBase('f'), symbols('n')
+    >>> sorted(expression_metrics(34*f[n-8] + 21*f[n-9], 0).items())
+    [('coefficient_bits', 6), ('ops', 5), ('summands', 3), ('tree_depth', 5)]
+    '''
+
+    summands, ops, depth, bits = 0, 0, 0, 0
+    for term in map(sympify, terms):
+        summands += summands_count(term)
+        ops += count_ops(term)
+        depth = max(depth, tree_depth(term))
+        bits = max(bits, coefficient_bits(term))
+
+    return dict(summands=summands, ops=ops, tree_depth=depth, coefficient_bits=bits)
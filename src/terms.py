@@ -1,13 +1,19 @@
 
-from sympy import flatten, Add, preorder_traversal
+from collections import defaultdict
+
+from sympy import flatten, Add, Indexed, Poly, PolynomialError, Wild, preorder_traversal
 from destructuring import *
+from utils import topological_order, DependencyCycleError
+from profiling import phase
 
 def explode_term_respect_to(term, cls, deep=False, container=list):
 
     exploded = [term] # we start with the given term since we've to build a list, eventually
 
     if isinstance(term, cls): 
-        exploded = flatten(term.expand().args, cls=cls) if deep else term.args
+        if deep:
+            with phase('expand'): exploded = flatten(term.expand().args, cls=cls)
+        else: exploded = term.args
 
     return container(exploded)
 
@@ -38,11 +44,126 @@ def indexed_terms_appearing_in(term, indexed, only_subscripts=False, do_traversa
 
     indexed_terms_set = set()
 
-    for subterm in preorder_traversal(term) if do_traversal else flatten(term.args, cls=Add):
-        try:
-            with bind_Mul_indexed(subterm, indexed) as (_, subscripts):
-                indexed_terms_set.add(subscripts if only_subscripts else indexed[subscripts])
-        except DestructuringError:
-            continue
+    def collect(subscripts):
+        indexed_terms_set.add(tuple(subscripts) if only_subscripts else indexed[subscripts])
+
+    if do_traversal:
+        for subterm in preorder_traversal(term):
+            try:
+                collect(destructure_Mul_indexed(subterm, indexed)[1])
+            except DestructuringError:
+                continue
+    else:
+        with bind_Add_indexed(term, indexed) as (destructured, _):
+            for _, subscripts in destructured: collect(subscripts)
 
     return list(indexed_terms_set)
+
+def subsume_terms(terms):
+    '''
+    Substitute definitions in `terms`, a mapping from terms to their definitions, into each
+    other until no definition mentions a defined term.
+
+    I build the dependency graph among definitions, where `k` depends on `j` if `j` appears
+    in the definition of `k`, and visit it in topological order, so each definition is 
+    rewritten once by already subsumed definitions; `DependencyCycleError` is raised if 
+    some terms are defined by each other. Since `subs` replaces a key such as `2*f[n-3]` 
+    also in its multiples, as `4*f[n-3]`, keys are found among atoms of definitions by their
+    `Indexed` terms, namely with coefficients divided out.
+
+    Moreover, summing subsumed definitions may yield multiples of keys that appear in none
+    of them, so a definition is rewritten by the keys on its atoms and, transitively, on 
+    atoms of their subsumed definitions; keys are substituted in reverse topological order,
+    hence after every key whose definition contributes to their atoms.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> f, n = IndexedBase('f'), symbols('n')
+    >>> subsumed = subsume_terms({f[n]: f[n-1] + f[n-2], f[n-1]: f[n-2] + f[n-3], f[n-2]: 2*f[n-3]})
+    >>> subsumed[f[n]], subsumed[f[n-1]]
+    (5*f[n - 3], 3*f[n - 3])
+    >>> subsume_terms({f[n]: f[n-1] + 1, f[n-1]: f[n] - 1})
+    Traceback (most recent call last):
+    ...
+    utils.DependencyCycleError: Cyclic dependencies: f[n] -> f[n - 1] -> f[n]
+    >>> subsumed = subsume_terms({f[n]: 4*f[n-3] + f[n-1], 2*f[n-3]: f[n-4], f[n-1]: 2*f[n-3]})
+    >>> subsumed[f[n]]
+    3*f[n - 4]
+    >>> subsume_terms({f[n]: f[n-1] + f[n-2], f[n-1]: f[n-3], f[n-2]: f[n-3], 2*f[n-3]: f[n-4]})[f[n]]
+    f[n - 4]
+    '''
+
+    keys_of_atom, other_keys = defaultdict(list), []
+    for k in terms:
+        atoms = [k] if isinstance(k, Indexed) else k.atoms(Indexed)
+        for atom in atoms: keys_of_atom[atom].append(k)
+        if not atoms: other_keys.append(k)
+
+    def dependencies_of(term):
+        if not term.free_symbols: return []
+        dependencies = [k for atom in term.atoms(Indexed) for k in keys_of_atom.get(atom, [])]
+        return dependencies + [k for k in other_keys if term.has(k)]
+
+    dependencies = {k: dependencies_of(v) for k, v in terms.items()}
+    order = topological_order(dependencies)
+    rank = {k: i for i, k in enumerate(order)}
+
+    subsumed, subsumed_atoms = {}, {}
+    for k in order:
+
+        substitutions, frontier, visited = set(dependencies[k]), list(terms[k].atoms(Indexed)), set()
+        while frontier:
+            atom = frontier.pop()
+            if atom in visited: continue
+            visited.add(atom)
+            for d in keys_of_atom.get(atom, []):
+                substitutions.add(d)
+                frontier.extend(subsumed_atoms[d])
+
+        substitutions = sorted(substitutions, key=rank.get, reverse=True)
+        subsumed[k] = terms[k].subs([(d, subsumed[d]) for d in substitutions]) if substitutions else terms[k]
+        subsumed_atoms[k] = subsumed[k].atoms(Indexed)
+
+    return subsumed
+
+def linear_coefficients(term, variables):
+    '''
+    Return the dictionary mapping each one of `variables` to its coefficient in `term`.
+
+    I read `term` once, as a polynomial in `variables`; if it isn't a polynomial of degree
+    at most one, then each variable is matched as a factor of `term` where other variables
+    are zero, and variables that cannot be matched are missing.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> m, a = IndexedBase('m'), Symbol('a')
+    >>> sorted(linear_coefficients(3*m[0,0] + m[1,0]/a + 1, [m[0,0], m[1,0]]).items(), key=str)
+    [(m[0, 0], 3), (m[1, 0], 1/a)]
+    >>> sorted(linear_coefficients(m[0,0]/(a + m[1,0]) + 2*m[1,0], [m[0,0], m[1,0]]).items(), key=str)
+    [(m[0, 0], 1/a), (m[1, 0], 2)]
+    >>> sorted(linear_coefficients(m[0,0]*m[1,0] + m[1,0], [m[0,0], m[1,0]]).items(), key=str)
+    [(m[0, 0], 0), (m[1, 0], 1)]
+    '''
+
+    gens = list(variables)
+
+    try:
+        monomials = Poly(term, *gens).as_dict()
+    except PolynomialError:
+        monomials = None
+
+    if monomials is not None and all(sum(monomial) <= 1 for monomial in monomials):
+        return {gens[monomial.index(1)]:coeff for monomial, coeff in monomials.items() if sum(monomial) == 1}
+
+    coefficients = {}
+    for var in gens:
+        wild_coeff = Wild("coeff")
+        nullified = term.subs({other:0 for other in gens if other != var}, simultaneous=True)
+        matched = nullified.match(wild_coeff*var)
+        if matched and wild_coeff in matched: coefficients[var] = matched[wild_coeff]
+
+    return coefficients
@@ -0,0 +1,230 @@
+
+from sympy import Dummy, Poly, Symbol
+
+from numerics import exact_number, int64_fits, residue
+from stencils import compile_stencil
+
+class riordan_kernel:
+    '''
+    The rule defining a row of a Riordan array from the previous one, with exact numbers.
+
+    I'm built from a `stencil` whose entries have row offset `-1`, and each of them is kept
+    as the triple `(col_offset, coefficients, constant)`, where `coefficients(r, cols)` returns
+    the list of coefficients for row `r` and each column in `cols`, and `constant` is the
+    coefficient itself if it doesn't depend on indexes, `None` otherwise; if every one is
+    constant, my `norm` is the sum of their absolute values, otherwise it is `None`.
+    '''
+
+    def __init__(self, entries, row, col):
+
+        self.entries = []
+        for row_offset, col_offset, coeff in entries:
+            if row_offset != -1:
+                raise ValueError('Each coefficient should depend on the previous row only, '
+                                 'while offset {} is given.'.format(row_offset))
+            constant = exact_number(coeff) if coeff.is_Number else None
+            self.entries.append((col_offset, self.evaluator(coeff, row, col), constant))
+
+        self.norm = None
+        if all(coeff.is_Number for _, _, coeff in entries):
+            self.norm = sum(abs(exact_number(coeff)) for _, _, coeff in entries)
+
+    @staticmethod
+    def evaluator(coeff, row, col):
+
+        if coeff.is_Number:
+            constant = exact_number(coeff)
+            return lambda r, cols: [constant] * len(cols)
+
+        if coeff.free_symbols - {row, col}:
+            raise ValueError('Coefficient {} should depend on indexes only.'.format(coeff))
+
+        terms = [(i, j, exact_number(c)) for (i, j), c in Poly(coeff, row, col).terms()]
+        return lambda r, cols: [sum(c * r**i * k**j for i, j, c in terms) for k in cols]
+
+def stencil_kernel(compiled):
+    if compiled is None: raise ValueError('The given recurrence is not shift invariant.')
+    return riordan_kernel(compiled.entries, compiled.row, compiled.col)
+
+def kernels_from_recs(Arec, Zrec=None, row_sym=Symbol('n'), col_sym=Symbol('k')):
+    '''
+    Return the pair of kernels for recurrences `Arec` and `Zrec`, as `unfold_in_matrix` accepts.
+    '''
+    indexed_sym = Arec.lhs.base
+    A = stencil_kernel(compile_stencil(Arec, indexed_sym, row_sym, col_sym))
+    Z = None if Zrec is None else stencil_kernel(
+            compile_stencil(Zrec, indexed_sym, row_sym, col_sym, first_column=True))
+    return A, Z
+
+def kernels_from_gfs(A_gf_spec, Z_gf_spec=None, left_offset=0):
+    '''
+    Return the pair of kernels for generating functions of A and Z sequences, where each
+    one is a triple `(gf, gf_var, terms)` as `build_rec_from_gf` accepts.
+    '''
+    row, col = Dummy('row'), Dummy('col')
+
+    def coefficients(gf_spec):
+        gf, gf_var, terms = gf_spec
+        gf_series = gf.series(gf_var, n=terms)
+        return [gf_series.coeff(gf_var, n=i) for i in range(terms)]
+
+    A = riordan_kernel([(-1, i - left_offset - 1, a) for i, a in enumerate(coefficients(A_gf_spec)) if a != 0],
+                       row, col)
+    Z = None if Z_gf_spec is None else riordan_kernel(
+            [(-1, i, z) for i, z in enumerate(coefficients(Z_gf_spec)) if z != 0], row, col)
+    return A, Z
+
+def riordan_rows(A, Z=None, top=1, diagonal_col_offset=1, dtype=None, modulus=None):
+    '''
+    Yield rows `0, 1, 2, ...` of the Riordan array defined by kernels `A` and `Z`, as built
+    by `kernels_from_recs` or `kernels_from_gfs`, where row `r` has `r*diagonal_col_offset + 1`
+    coefficients and the only one in row `0` is `top`; if `Z` is `None`, then `A` defines
+    coefficients in column `0` too, as `unfold_in_matrix` does.
+
+    Rows are lists of exact numbers if `dtype` is `None`, otherwise NumPy arrays of that
+    type, namely `object` for exact numbers or `int64`; in the latter case, `OverflowError`
+    is raised as soon as a coefficient could not fit. Each row is computed from the previous
+    one by a shifted, element-wise, multiply-and-add for each entry of the kernels.
+
+    If a `modulus` is given, rows are `int64` arrays of residues, computed modulo `modulus`
+    from the previous row of residues, hence they never overflow and rows far beyond the 
+    reach of exact arithmetic can be computed; rational coefficients are read as products
+    by inverses modulo `modulus`.
+
+    Examples
+    ========
+
+    >>> from itertools import islice
+    >>> from sympy import *
+    >>> d, n, k, t = IndexedBase('d'), *symbols('n k t')
+    >>> pascal = kernels_from_recs(Eq(d[n+1, k+1], d[n, k] + d[n, k+1]))
+    >>> list(islice(riordan_rows(*pascal), 5))
+    [[1], [1, 1], [1, 2, 1], [1, 3, 3, 1], [1, 4, 6, 4, 1]]
+    >>> stirling = kernels_from_recs(Eq(d[n+1, k+1], d[n, k] + (k+1)*d[n, k+1]), Eq(d[n+1, 0], 0))
+    >>> list(islice(riordan_rows(*stirling), 5))[-1]
+    [0, 1, 7, 6, 1]
+    >>> catalan = kernels_from_gfs((1/(1-t), t, 6))
+    >>> list(islice(riordan_rows(*catalan), 5))[-1]
+    [14, 14, 9, 4, 1]
+    '''
+
+    if modulus is not None: 
+        if not int64_fits(modulus - 1 + (modulus - 1)**2):
+            raise ValueError('Modulus {} is too big for residues to be multiplied in int64.'.format(modulus))
+        dtype = 'int64'
+
+    checked = False
+    if dtype is not None:
+        import numpy as np
+        dtype = np.dtype(dtype)
+        if dtype not in (np.dtype(object), np.dtype(np.int64)): 
+            raise ValueError('Rows can be computed as `object` or `int64` arrays only.')
+        checked = dtype == np.int64 and modulus is None
+
+    def overflow(r): 
+        return OverflowError('Row {} does not fit in int64, use `dtype=object`.'.format(r))
+
+    # `int64` residues are summed as Python ints, which cannot overflow
+    scalar = int if modulus is not None else (lambda v: v)
+
+    def reduced(coeff): 
+        return coeff if modulus is None else residue(coeff, modulus)
+
+    def as_row(values):
+        values = [reduced(v) for v in values]
+        if dtype is None: return values
+        if checked and not int64_fits(max(abs(v) for v in values)): raise overflow(r)
+        return np.array(values, dtype=dtype)
+
+    def bound(kernel, r, cols):
+        if kernel.norm is not None: return kernel.norm
+        columns = [[abs(v) for v in coefficients(r, cols)] for _, coefficients, _ in kernel.entries]
+        return max(map(sum, zip(*columns)), default=0)
+
+    r, previous = 0, as_row([top])
+    yield previous
+
+    while True:
+        r += 1
+        width = r * diagonal_col_offset + 1
+        cols = list(range(width))
+
+        # int64 rows are computed only if every coefficient surely fits
+        if checked:
+            greatest = int(np.abs(previous).max())
+            if not int64_fits(greatest * max(bound(A, r, cols), bound(Z, r, [0]) if Z else 0)): raise overflow(r)
+
+        row = [0] * width if dtype is None else np.zeros(width, dtype=dtype)
+
+        for col_offset, coefficients, constant in A.entries:
+            # cells `c` such that `0 <= c + col_offset < len(previous)`
+            start, stop = max(0, -col_offset), min(width, len(previous) - col_offset)
+            if start >= stop: continue
+            if dtype is None:
+                coeffs = coefficients(r, cols[start:stop])
+                for c, coeff in zip(range(start, stop), coeffs): row[c] += coeff * previous[c + col_offset]
+                continue
+
+            coeffs = (reduced(constant) if constant is not None 
+                        else as_row(coefficients(r, cols[start:stop])))
+            row[start:stop] += coeffs * previous[start + col_offset:stop + col_offset]
+            if modulus is not None: row[start:stop] %= modulus
+
+        if Z is not None:
+            row[0] = reduced(sum(reduced(coefficients(r, [0])[0]) * scalar(previous[col_offset])
+                                 for col_offset, coefficients, _ in Z.entries if 0 <= col_offset < len(previous)))
+
+        previous = row
+        yield row
+
+def riordan_array(rows, Arec=None, Zrec=None, gfs=None, top=1, diagonal_col_offset=1, dtype=None, 
+                  modulus=None, **kwds):
+    '''
+    Return the first `rows` rows of the Riordan array defined either by recurrences `Arec`
+    and `Zrec`, or by the pair `gfs` of generating functions of A and Z sequences, as a list
+    of rows; if `dtype` is given, a lower triangular NumPy matrix is returned instead.
+    Keyword arguments `kwds` are forwarded to `kernels_from_recs` or `kernels_from_gfs`.
+
+    If a `modulus` is given, the matrix holds residues, as `riordan_rows` computes them, and
+    cells above the diagonal are `-1`, to tell them apart from the residue `0` when colouring.
+    '''
+
+    if gfs is not None: A, Z = kernels_from_gfs(*gfs, **kwds)
+    else: A, Z = kernels_from_recs(Arec, Zrec, **kwds)
+
+    generated = riordan_rows(A, Z, top=top, diagonal_col_offset=diagonal_col_offset, dtype=dtype, modulus=modulus)
+    triangle = [row for _, row in zip(range(rows), generated)]
+    if dtype is None and modulus is None: return triangle
+
+    import numpy as np
+    shape = rows, (rows - 1) * diagonal_col_offset + 1
+    matrix = np.zeros(shape, dtype=dtype) if modulus is None else np.full(shape, -1, dtype=np.int64)
+    for r, row in enumerate(triangle): matrix[r, :len(row)] = row
+    return matrix
+
+def congruence_colours(triangle, palette):
+    '''
+    Return the dictionary mapping each cell `(r, c)` of `triangle` to the colour that
+    `palette` assigns to its residue, as the `colors` argument of `clean_up_zeros` expects;
+    `triangle` is a list of rows or a matrix of residues, where negative ones are skipped,
+    and `palette` is either a dictionary from residues to colours or a list of colours.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> d, n, k = IndexedBase('d'), *symbols('n k')
+    >>> pascal = riordan_array(5, Eq(d[n+1, k+1], d[n, k] + d[n, k+1]))
+    >>> parities = [[v % 2 for v in row] for row in pascal]
+    >>> sorted(congruence_colours(parities, {0: 'red'}))
+    [(2, 1), (4, 1), (4, 2), (4, 3)]
+    '''
+
+    if not isinstance(palette, dict): palette = dict(enumerate(palette))
+
+    colours = {}
+    for r, row in enumerate(triangle):
+        for c, cell in enumerate(row):
+            colour = palette.get(int(cell)) if cell >= 0 else None
+            if colour is not None: colours[r, c] = colour
+    return colours
@@ -0,0 +1,105 @@
+
+import io
+
+from sympy.printing.latex import latex
+
+from caching import lru_terms_cache
+
+def make_latex_cache(maxsize=1 << 16):
+    '''
+    Return an empty cache of LaTeX sources of terms, to be shared by the writes of one call;
+    its lookups are counted apart from the ones of unfoldings.
+    '''
+    return lru_terms_cache(maxsize=maxsize, name='latex_cache')
+
+def cached_latex(term, cache=None):
+    '''
+    Return `latex(term)`, typesetting `term` only the first time it's requested to `cache`,
+    if given, otherwise every time.
+    '''
+    if cache is None: return latex(term)
+
+    src = cache.lookup(term)
+    if src is None: src = cache[term] = latex(term)
+    return src
+
+def write_latex_matrix(stream, matrix, label="", colors={}, environment="equation",
+                       cancel_zeros=True, diagonal_col_offset=1, cache=None):
+    '''
+    Write the TeX source of `matrix` in `stream`, row by row, where entries above the
+    diagonal of slope `diagonal_col_offset` are left blank, as zero entries are if
+    `cancel_zeros`; entries in `colors` are wrapped by `\\textcolor`. Entries are typeset
+    once through `cache`, a new one unless given.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> from sympy.abc import x
+    >>> stream = io.StringIO()
+    >>> write_latex_matrix(stream, Matrix([[1, 0], [x**2, 0]]), colors={(1, 0): 'red'}, environment=None)
+    >>> print(stream.getvalue())
+    \\left[\\begin{array}{cc}
+    1 &  \\\\
+    \\textcolor{red}{x^{2}} &  \\\\
+    \\end{array}\\right]
+    '''
+
+    if diagonal_col_offset is None: diagonal_col_offset = 1
+    if cache is None: cache = make_latex_cache()
+
+    if environment: stream.write(r"\begin{" + environment + r"}" + "\n")
+    stream.write(r"\left[\begin{array}{" + ('c' * matrix.cols) + r'}' + "\n")
+
+    for r in range(matrix.rows):
+        for c in range(matrix.cols):
+
+            space = "" if c == 0 else " "
+
+            if r*diagonal_col_offset < c: coeff_str = ""
+            elif cancel_zeros and matrix[r,c] == 0: coeff_str = ""
+            else: coeff_str = cached_latex(matrix[r,c], cache)
+
+            if (r,c) in colors: coeff_str = r'\textcolor{' + colors[(r,c)] + r'}{' + coeff_str + "}"
+            stream.write("{}{} {}".format(space, coeff_str, r'\\' if c == matrix.cols-1 else r'&'))
+
+        if r < matrix.rows - 1: stream.write("\n")
+
+    stream.write("\n" + r'\end{array}\right]')
+    if environment:
+        stream.write("\n" + (r'\label{eq:' + label + r'}' + "\n" if label else ""))
+        stream.write(r'\end{' + environment + '}')
+
+def write_latex_matrix_expansion(stream, matrix_expansion, *args, **kwds):
+    '''
+    Write the TeX source of the sum of `coefficient * matrix` terms in `matrix_expansion`
+    in `stream`, term by term, sharing one cache of LaTeX sources among them.
+    '''
+    kwds['environment'] = None
+    if kwds.get('cache') is None: kwds['cache'] = make_latex_cache()
+    for i, (coefficient, matrix) in enumerate(matrix_expansion.items()):
+        if i: stream.write(" + ")
+        stream.write(cached_latex(coefficient, kwds['cache']))
+        write_latex_matrix(stream, matrix, *args, **kwds)
+
+def write_latex_array(stream, terms, cache=None):
+    '''
+    Write the TeX source of a one column array of `terms` in `stream`, one by one, as they
+    are consumed; `terms` can be given lazily, as `recurrence_spec.map` yields them, and
+    they are typeset once through `cache`, a new one unless given.
+    '''
+    if cache is None: cache = make_latex_cache()
+
+    stream.write(r"\begin{array}{c}")
+    for i, term in enumerate(terms):
+        if i: stream.write("\n")
+        stream.write(cached_latex(term, cache) + r"\\")
+    stream.write(r"\end{array}")
+
+def latex_to_string(writer, *args, **kwds):
+    '''
+    Return what `writer` writes in a stream, as a string.
+    '''
+    stream = io.StringIO()
+    writer(stream, *args, **kwds)
+    return stream.getvalue()
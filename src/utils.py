@@ -57,6 +57,59 @@ def invert_dict(mapping, check_bijection=True):
 
     return inverted
 
+class DependencyCycleError(ValueError): 
+    '''
+    Represent a cycle among dependencies, which is available as a list of nodes in `cycle`.
+    '''
+
+    def __init__(self, cycle):
+        ValueError.__init__(self, 'Cyclic dependencies: {}'.format(' -> '.join(map(str, cycle))))
+        self.cycle = cycle
+
+def topological_order(dependencies):
+    '''
+    Sort nodes such that each one follows every node it depends on.
+
+    `dependencies` maps each node to an iterable of nodes it depends on; nodes that are not
+    keys of `dependencies` are ignored. I visit in depth-first fashion without recursion, so
+    long chains are fine, and raise `DependencyCycleError` as soon as a cycle is found.
+
+    Examples
+    ========
+
+    >>> topological_order({'a': ['b', 'c'], 'b': ['c'], 'c': [], 'd': ['z']})
+    ['c', 'b', 'a', 'd']
+    >>> topological_order({'a': ['b'], 'b': ['c'], 'c': ['a']})
+    Traceback (most recent call last):
+    ...
+    utils.DependencyCycleError: Cyclic dependencies: a -> b -> c -> a
+    '''
+
+    order, visited, visiting = [], set(), []
+
+    for root in dependencies:
+
+        if root in visited: continue
+
+        stack = [(root, iter(dependencies[root]))]
+        visiting.append(root)
+        while stack:
+            node, pending = stack[-1]
+            for dependency in pending:
+                if dependency not in dependencies or dependency in visited: continue
+                if dependency in visiting:
+                    raise DependencyCycleError(visiting[visiting.index(dependency):] + [dependency])
+                stack.append((dependency, iter(dependencies[dependency])))
+                visiting.append(dependency)
+                break
+            else:
+                stack.pop()
+                visiting.pop()
+                visited.add(node)
+                order.append(node)
+
+    return order
+
 def latex_array_src(iterable, delimiters='{}', math_environment='displaymath'):
 
     from IPython.display import Latex
@@ -0,0 +1,113 @@
+
+import random
+
+from sympy import Function, Indexed, Symbol
+
+from numerics import exact_number, modular_inverse, residue
+
+# the Mersenne prime `2**61 - 1`, so that products of residues stay small Python ints
+large_prime = 2**61 - 1
+
+class modular_evaluator:
+    '''
+    Evaluator of polynomial, or rational, terms modulo `modulus` at `point`, a dictionary
+    from atoms to their residues; values of subterms are memoized, so shared ones are
+    evaluated once.
+    '''
+
+    def __init__(self, point, modulus):
+        self.point = point
+        self.modulus = modulus
+        self.memo = {}
+
+    def __call__(self, term):
+        value = self.memo.get(term)
+        if value is None: value = self.memo[term] = self.evaluate(term)
+        return value
+
+    def evaluate(self, term):
+
+        p = self.modulus
+
+        if term in self.point: return self.point[term]
+        if term.is_Rational: return residue(exact_number(term), p)
+        if term.is_Add: return sum(map(self, term.args)) % p
+
+        if term.is_Mul:
+            value = 1
+            for arg in term.args: value = value * self(arg) % p
+            return value
+
+        if term.is_Pow and term.exp.is_Integer:
+            base = self(term.base)
+            if term.exp < 0: base = modular_inverse(base, p)
+            return pow(base, abs(int(term.exp)), p)
+
+        raise ValueError('{} cannot be evaluated modulo {}.'.format(term, p))
+
+def free_leaves(terms):
+    '''
+    Return the set of symbols, indexed terms and function applications that `terms` are
+    built from; applications, as generic elements `m(n, k)` of `Function('m')`, are leaves
+    as a whole, hence their arguments are not visited.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> m, g, n = Function('m'), IndexedBase('g'), Symbol('n')
+    >>> sorted(free_leaves([m(1, 0)*m(1, 1) + 2*g[n], m(1, 0)**2 + n]), key=str)
+    [g[n], m(1, 0), m(1, 1), n]
+    >>> random_mismatch(Matrix([[(m(0, 0) + m(1, 0))**2]]), Matrix([[m(0, 0)**2 + m(1, 0)**2]]))
+    (0, 0)
+    '''
+    leaves, frontier = set(), list(terms)
+    while frontier:
+        term = frontier.pop()
+        if isinstance(term, (Indexed, Symbol, Function)): leaves.add(term)
+        else: frontier.extend(term.args)
+    return leaves
+
+def random_mismatch(lhs, rhs, trials=4, substitutions={}, modulus=large_prime, rng=None):
+    '''
+    Return the first cell `(r, c)` where matrices `lhs` and `rhs` differ, evaluating both
+    of them modulo `modulus` at `trials` random points; if they agree on each point, then
+    `None` is returned. Atoms in `substitutions` are replaced simultaneously by their values
+    in `rhs` only, as `check_matrix_expansion` does with `inits`.
+
+    Neither `expand` nor any other symbolic manipulation is performed, so I cost a linear
+    pass over the terms per trial; by the Schwartz-Zippel lemma, polynomials of degree `d`
+    that are different agree on a random point with probability at most `d/modulus`, hence
+    a returned cell surely differs while `None` is wrong with a negligible probability.
+
+    Examples
+    ========
+
+    >>> from sympy import *
+    >>> m = IndexedBase('m')
+    >>> lhs = Matrix([[(m[0,0] + m[1,0])**2, m[0,0]]])
+    >>> rhs = Matrix([[m[0,0]**2 + 2*m[0,0]*m[1,0] + m[1,0]**2, m[1,0]]])
+    >>> random_mismatch(lhs, rhs)
+    (0, 1)
+    >>> random_mismatch(lhs, rhs, substitutions={m[1,0]: m[0,0]})
+    (0, 0)
+    >>> random_mismatch(lhs.subs(m[1,0], m[0,0]), rhs, substitutions={m[1,0]: m[0,0]}) is None
+    True
+    '''
+
+    if rng is None: rng = random.Random()
+
+    cells = [(r, c) for r in range(lhs.rows) for c in range(lhs.cols)]
+    leaves = free_leaves([lhs[cell] for cell in cells] + [rhs[cell] for cell in cells] + list(substitutions.values()))
+
+    for _ in range(trials):
+        point = {leaf: rng.randrange(modulus) for leaf in leaves}
+        evaluate_lhs = modular_evaluator(point, modulus)
+        substituted = dict(point)
+        substituted.update({atom: evaluate_lhs(term) for atom, term in substitutions.items()})
+        evaluate_rhs = modular_evaluator(substituted, modulus)
+
+        for cell in cells:
+            if evaluate_lhs(lhs[cell]) != evaluate_rhs(rhs[cell]): return cell
+
+    return None